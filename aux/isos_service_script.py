@@ -0,0 +1,12 @@
+import sys
+import asyncio
+from isos.service import QueryService, serve
+
+if __name__ == '__main__':
+    dbname    = sys.argv[1]
+    user      = sys.argv[2]
+    password  = sys.argv[3]
+    port      = int(sys.argv[4])
+    socket    = sys.argv[5]  # path of the Unix socket
+
+    asyncio.run(serve(QueryService(dbname, user, password, port=port), path=socket))
@@ -0,0 +1,12 @@
+import sys
+from isos.watch import watch
+
+if __name__ == '__main__':
+    directories = sys.argv[1].split(',')
+    print(directories)
+    dbname    = sys.argv[2]
+    user      = sys.argv[3]
+    password  = sys.argv[4]
+    port      = int(sys.argv[5])
+
+    watch(directories, dbname, user, password, port)
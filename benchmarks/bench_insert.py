@@ -0,0 +1,45 @@
+"""
+benchmark the bulk insert (INSERT ... ON CONFLICT) against the per entry insert of Database.insert,
+on synthetic entries of table existings1 in a scratch database that is dropped afterwards
+
+    $ python benchmarks/bench_insert.py --rows 20000 --user user --password password --port 5432
+"""
+import time
+import argparse
+from isos.database import Database, drop_archive
+
+
+def entries(rows, offset=0):
+    return [{'scene': '/search_dir/S1A_IW_GRDH_1SDV_20150222T170750_20150222T170815_004739_005DD8_{:08X}.zip'.format(i),
+             'outname_base': 'S1A_IW_GRDH_1SDV_20150222T170750_20150222T170815_004739_005DD8_{:08X}.zip'.format(i),
+             'read_permission': 1,
+             'file_size_MB': 1650,
+             'owner': '1000'} for i in range(offset, offset + rows)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--dbname', default='isos_bench')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    args = parser.parse_args()
+
+    db = Database(args.dbname, user=args.user, password=args.password, host=args.host, port=args.port, cleanup=False)
+    try:
+        for bulk in [False, True]:
+            db.conn.execute('TRUNCATE existings1;')
+            # half of the second batch is already registered
+            for label, data in [('new', entries(args.rows)), ('update', entries(args.rows, args.rows // 2))]:
+                start = time.perf_counter()
+                counts = db.insert('existings1', ['scene'], data, update=True, bulk=bulk)
+                print('{:<9} {:<7} {:>8.2f} s  {}'.format('bulk' if bulk else 'per entry', label,
+                                                          time.perf_counter() - start, counts))
+    finally:
+        drop_archive(db)
+
+
+if __name__ == '__main__':
+    main()
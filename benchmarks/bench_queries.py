@@ -0,0 +1,78 @@
+"""
+benchmark Database.query_db on synthetic entries of table sentinel1data without and with the secondary indexes
+created by Database.ensure_indexes, in a scratch database that is dropped afterwards
+
+    $ python benchmarks/bench_queries.py --rows 200000 --user user --password password --port 5432
+"""
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from isos.database import Database, drop_archive
+from isos.database_tables import Sentinel1Data
+from spatialist.vector import wkt2vector
+
+
+def entries(rows, seed=42):
+    rnd = random.Random(seed)
+    for i in range(rows):
+        start = datetime(2015, 1, 1) + timedelta(seconds=rnd.randrange(6 * 365 * 86400))
+        stop = start + timedelta(seconds=25)
+        x, y = rnd.uniform(-180, 178), rnd.uniform(-85, 83)
+        poly = 'SRID=4326;POLYGON(({0} {1},{2} {1},{2} {3},{0} {3},{0} {1}))'.format(x, y, x + 2, y + 2)
+        name = 'S1A_IW_GRDH_1SDV_{}_{}_{:06d}_005DD8_{:04X}'.format(start.strftime('%Y%m%dT%H%M%S'),
+                                                                   stop.strftime('%Y%m%dT%H%M%S'),
+                                                                   rnd.randrange(1, 40000), i % 65536)
+        yield {'sensor': 'S1A', 'orbit': rnd.choice(['A', 'D']), 'orbitNumber_rel': rnd.randrange(1, 176),
+               'acquisition_mode': 'IW', 'start': start.strftime('%Y%m%dT%H%M%S'),
+               'stop': stop.strftime('%Y%m%dT%H%M%S'), 'product': 'GRD',
+               'outname_base': name, 'scene': '/search_dir/{}.zip'.format(name), 'bbox': poly, 'geometry': poly}
+
+
+site = 'POLYGON((10 50,11 50,11 51,10 51,10 50))'
+
+queries = {'intersects': lambda: dict(vectorobject=wkt2vector(site, srs=4326)),
+           'date range': lambda: dict(date=['20180101T000000', '20180108T000000']),
+           'orbit': lambda: dict(orbitNumber_rel=117),
+           'outname_base': lambda: dict(outname_base='S1A_IW_GRDH_1SDV_20180101T000000_20180101T000025_012345_005DD8_0001')}
+
+
+def run(db, repeat):
+    for label, kwargs in queries.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            found = db.query_db('sentinel1data', **kwargs())
+        print('{:<13} {:>9.2f} ms  {} entries'.format(label, (time.perf_counter() - start) / repeat * 1000,
+                                                     len(found)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--dbname', default='isos_bench')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    args = parser.parse_args()
+
+    db = Database(args.dbname, user=args.user, password=args.password, host=args.host, port=args.port, cleanup=False)
+    try:
+        db.insert('sentinel1data', ['scene'], list(entries(args.rows)), bulk=True)
+        table = Sentinel1Data.__table__
+        names = [index.name for index in table.indexes] + ['idx_sentinel1data_bbox', 'idx_sentinel1data_geometry']
+        for name in names:
+            db.conn.execute('DROP INDEX IF EXISTS "{}";'.format(name))
+        db.conn.execute('ANALYZE sentinel1data;')
+        print('without secondary indexes:')
+        run(db, args.repeat)
+        print('created {}'.format(', '.join(db.ensure_indexes())))
+        print('with secondary indexes:')
+        run(db, args.repeat)
+    finally:
+        drop_archive(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+time the conversion of Sentinel-2 metadata dicts to the column types of table sentinel2data, per-key type
+lookups as done before against the converters compiled once per schema. The metadata of the given zips
+(MTD_MSIL1C.xml / MTD_MSIL2A.xml, read with GDAL) is repeated to the requested number of dicts, no database needed.
+
+    $ python benchmarks/bench_s2_convert.py --count 5000 tests/data/S2*.zip
+"""
+import time
+import argparse
+from datetime import datetime
+from dateutil import parser as dateparser
+from geoalchemy2 import WKTElement
+from isos.database import _read_s2_metadata, _compile_converters, _convert_metadata
+from isos.database_tables import Sentinel2Data
+
+
+def convert_per_key(entries, coltypes):
+    """
+    the conversion before the converters were compiled, for comparison
+    """
+    orderly_data = []
+    for entry in entries:
+        temp_dict = {}
+        for key, value in entry[1].items():
+            key = key.lower().replace(' ', '_')
+            if str(coltypes.get(key)) == 'VARCHAR':
+                temp_dict[key] = value
+            if str(coltypes.get(key)) == 'INTEGER':
+                temp_dict[key] = int(value.replace('.0', ''))
+            if str(coltypes.get(key)) in ['DOUBLE PRECISION', 'FLOAT', 'DOUBLE_PRECISION']:
+                temp_dict[key] = float(value)
+            if str(coltypes.get(key)) in ['TIMESTAMP', 'TIMESTAMP WITHOUT TIME ZONE', 'DATETIME']:
+                if value != '' and value:
+                    try:
+                        temp_dict[key] = dateparser.parse(value)
+                    except ValueError:
+                        temp_dict[key] = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ')
+            if str(coltypes.get(key)) in ['geometry(POLYGON,4326)']:
+                temp_dict[key] = WKTElement(value, srid=4326)
+        orderly_data.append(temp_dict)
+    return orderly_data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenes', nargs='+', help='Sentinel-2 zips')
+    parser.add_argument('--count', type=int, default=5000, help='number of metadata dicts to convert')
+    args = parser.parse_args()
+
+    metadata = [x for x in map(_read_s2_metadata, args.scenes) if x[1] is not None]
+    if len(metadata) == 0:
+        raise RuntimeError('no Sentinel-2 metadata could be read')
+    entries = [metadata[i % len(metadata)] for i in range(args.count)]
+    table_schema = Sentinel2Data.__table__
+    print('{} metadata dicts with {} keys on average'.format(
+        len(entries), sum(len(x[1]) for x in entries) // len(entries)))
+
+    start = time.perf_counter()
+    coltypes = {column.name: column.type for column in table_schema.c}
+    before = convert_per_key(entries, coltypes)
+    print('per key:   {:.3f} s'.format(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    converters = _compile_converters(table_schema)
+    after = [x[1] for x in _convert_metadata(entries, converters)]
+    print('compiled:  {:.3f} s'.format(time.perf_counter() - start))
+
+    differing = sum(1 for x, y in zip(before, after) if set(x) != set(y))
+    print('dicts with differing keys: {}'.format(differing))
+
+
+if __name__ == '__main__':
+    main()
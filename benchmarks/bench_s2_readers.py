@@ -0,0 +1,39 @@
+"""
+time reading the metadata of Sentinel-2 zips with GDAL's /vsizip/ against zipfile with an incremental XML parser,
+see Database.identify_sentinel2_from_folder, and compare the keys and values both return.
+
+    $ python benchmarks/bench_s2_readers.py --rounds 20 --workers 4 tests/data/S2*.zip
+"""
+import os
+import time
+import argparse
+from isos.database import s2_readers, _imap_bounded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenes', nargs='+', help='Sentinel-2 zips')
+    parser.add_argument('--rounds', type=int, default=10, help='number of times each scene is read')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ['CPL_ZIP_ENCODING'] = 'UTF-8'
+    scenes = args.scenes * args.rounds
+    results = {}
+    for backend, reader in s2_readers.items():
+        start = time.perf_counter()
+        results[backend] = dict(_imap_bounded(reader, scenes, args.workers))
+        elapsed = time.perf_counter() - start
+        print('{:5s} {:.3f} s, {:.2f} ms per scene'.format(backend, elapsed, elapsed / len(scenes) * 1000))
+
+    for scene in args.scenes:
+        gdal_metadata = results['gdal'][scene] or {}
+        zip_metadata = results['zip'][scene] or {}
+        differing = sorted(key for key in set(gdal_metadata) | set(zip_metadata)
+                           if gdal_metadata.get(key) != zip_metadata.get(key))
+        if differing:
+            print('{}: differing keys {}'.format(scene, ', '.join(differing)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+benchmark the single-pass parallel scene search against the former two finder passes
+
+    $ python benchmarks/bench_scanner.py --files 120000 --workers 16
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from spatialist.ancillary import finder
+from isos.search_and_deploy import pattern_s1, pattern_s2, scan_directory
+
+
+def scene_name(i):
+    """
+    file name number `i` of the synthetic archive: half scenes, half other files, partly with a scene prefix
+    """
+    kind = i % 4
+    if kind == 0:
+        return 'S1A_IW_GRDH_1SDV_20150222T170750_20150222T170815_004739_005DD8_{:04X}.zip'.format(i % 0x10000)
+    if kind == 1:
+        return 'S2B_MSIL2A_20220117T095239_N0301_R079_T32QMG_20220117T{:06d}.zip'.format(i % 1000000)
+    if kind == 2:
+        return 'S2B_MSIL2A_20220117T095239_N0301_R079_T32QMG_{}.xml'.format(i)
+    return 'auxiliary_{}.tif'.format(i)
+
+
+def make_tree(root, files, per_folder=500):
+    """
+    create a synthetic archive of empty files in folders of two levels
+    """
+    for i in range(files):
+        folder = os.path.join(root, 'year_{}'.format(i // (per_folder * 20)), 'folder_{}'.format(i // per_folder))
+        if i % per_folder == 0:
+            os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, scene_name(i)), 'w').close()
+
+
+def finder_passes(directory):
+    scenes_s1 = finder(directory, [pattern_s1], recursive=True, regex=True)
+    scenes_s2 = finder(directory, [pattern_s2], recursive=True, regex=True)
+    return {scene: (os.stat(scene).st_size, os.stat(scene).st_uid) for scene in scenes_s1 + scenes_s2}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=120000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--directory', default=None, help='existing directory to search instead of a synthetic tree')
+    args = parser.parse_args()
+
+    root = args.directory or tempfile.mkdtemp()
+    try:
+        if args.directory is None:
+            make_tree(root, args.files)
+        for name, function in [('finder, two passes', finder_passes),
+                               ('scan_directory, 1 worker', lambda x: scan_directory(x, workers=1)),
+                               ('scan_directory, {} workers'.format(args.workers),
+                                lambda x: scan_directory(x, workers=args.workers))]:
+            start = time.perf_counter()
+            found = function(root)
+            print('{:<30} {:>8} scenes {:>8.2f} s'.format(name, len(found), time.perf_counter() - start))
+    finally:
+        if args.directory is None:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+count the catalog queries (pg_catalog, information_schema, geometry_columns) sent during an ingest,
+in a scratch database that is dropped afterwards. Scenes to ingest can be given, otherwise synthetic entries
+are written to table existings1 chunk by chunk.
+
+    $ python benchmarks/bench_schema_cache.py --user user --password password --port 5432 tests/data/*.zip
+"""
+import re
+import time
+import argparse
+from sqlalchemy import event
+from isos.database import Database, drop_archive
+
+catalog = re.compile(r'pg_catalog|information_schema|geometry_columns|pg_class|pg_attribute', re.IGNORECASE)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenes', nargs='*', help='Sentinel-1/2 zips to ingest')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--chunksize', type=int, default=1000)
+    parser.add_argument('--dbname', default='isos_bench')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    args = parser.parse_args()
+
+    counts = {'catalog': 0, 'other': 0}
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counts['catalog' if catalog.search(statement) else 'other'] += 1
+
+    start = time.perf_counter()
+    db = Database(args.dbname, user=args.user, password=args.password, host=args.host, port=args.port, cleanup=False)
+    try:
+        event.listen(db.engine, 'before_cursor_execute', count)
+        print('construction: {:.2f} s'.format(time.perf_counter() - start))
+        start = time.perf_counter()
+        if len(args.scenes) > 0:
+            db.ingest_s1_from_id([x for x in args.scenes if 'S1' in x], chunksize=args.chunksize)
+            db.ingest_s2_from_id([x for x in args.scenes if 'S2' in x], chunksize=args.chunksize)
+        else:
+            for i in range(0, args.rows, args.chunksize):
+                db.insert('existings1', db.get_primary_keys('existings1'),
+                          [{'scene': '/search_dir/{}.zip'.format(j), 'outname_base': '{}.zip'.format(j)}
+                           for j in range(i, i + args.chunksize)], bulk=True)
+        print('ingest: {:.2f} s, {} catalog queries, {} other statements'.format(
+            time.perf_counter() - start, counts['catalog'], counts['other']))
+    finally:
+        drop_archive(db)
+
+
+if __name__ == '__main__':
+    main()
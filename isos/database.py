@@ -2,37 +2,71 @@
 import importlib
 import inspect
 import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dateutil import parser
 import gc
+import errno
+import hashlib
+import struct
+import zipfile
 import os
 import re
+import queue
+import threading
+import multiprocessing
+from itertools import islice
 import shutil
 import sys
 import socket
 import time
 import logging
+import warnings
 import progressbar as pb
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from xml.etree import ElementTree
 from osgeo import gdal
 
 from spatialist import Vector
 from pyroSAR.drivers import identify, ID
 
-from sqlalchemy import create_engine, Table, MetaData, exists
+from sqlalchemy import create_engine, Table, MetaData, exists, literal_column, select, bindparam, any_, \
+    type_coerce, text, cast, or_, and_, union_all, Integer, Float, DateTime, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY, aggregate_order_by
 from sqlalchemy import inspect as sql_inspect
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
 from sqlalchemy.engine.url import URL
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy_utils import database_exists, create_database, drop_database
-from geoalchemy2 import WKTElement
+from geoalchemy2 import WKTElement, Geometry
 
 from .database_tables import *  # needs to stay here to create tables
+from .metadata_cache import MetadataCache
 
 
 log = logging.getLogger(__name__)
 
+# scene file names with the fields registered by Database.ingest_light
+light_patterns = {
+    'sentinel1data': re.compile(
+        r'^(?P<sensor>S1[AB])_(?P<acquisition_mode>S1|S2|S3|S4|S5|S6|IW|EW|WV|EN|N1|N2|N3|N4|N5|N6|IM)_'
+        r'(?P<product>SLC|GRD|OCN)(?:F|H|M|_)_(?:1|2)(?:S|A)(?P<polarization>SH|SV|DH|DV|VV|HH|HV|VH)_'
+        r'(?P<start>[0-9]{8}T[0-9]{6})_(?P<stop>[0-9]{8}T[0-9]{6})_(?P<orbitNumber_abs>[0-9]{6})_'
+        r'(?P<datatake_id>[0-9A-F]{6})_(?P<product_unique_id>[0-9A-F]{4})\.zip$'),
+    'sentinel2data': re.compile(
+        r'^(?P<sensor>S2[AB])_MSI(?P<level>L1C|L2A)_(?P<start>[0-9]{8}T[0-9]{6})_N(?P<baseline>[0-9]{4})_'
+        r'R(?P<relative_orbit>[0-9]{3})_T(?P<mgrs_tile>[0-9A-Z]{5})_(?:[0-9]{8}T[0-9]{6})\.zip$')}
+
+
+# element paths of the Sentinel-2 MTD files read by _parse_s2_metadata
+s2_product_info = [('General_Info', 'Product_Info'), ('General_Info', 'L2A_Product_Info')]
+s2_image_characteristics = [('General_Info', 'Product_Image_Characteristics'),
+                            ('General_Info', 'L2A_Product_Image_Characteristics')]
+s2_bands = ['B1', 'B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B8', 'B8A', 'B9', 'B10', 'B11', 'B12']
+
 
 class Database(object):
     """
@@ -51,12 +85,27 @@ class Database(object):
         required for postgres driver: port number to the database. Default: 5432
     cleanup: bool
         check whether all registered scenes exist and remove missing entries?
+        Set to False to skip the check at construction and call :meth:`cleanup` when needed.
+    shared: bool
+        use the pooled engine shared by all Database objects of this process for the same database
+        (see :func:`get_engine`) instead of an own engine, which is not disposed on :meth:`close`
+    fast: bool
+        skip the host check and the database creation, and skip the table creation and migration
+        if the schema version stored in the database is the current one. The database must exist.
+    metadata_cache: str or MetadataCache or None
+        cache of the metadata read from the scene files (or the path of its file), consulted by :meth:`parse_id`
+        and :meth:`identify_sentinel2_from_folder` before opening a scene, see :mod:`isos.metadata_cache`
     """
 
     def __init__(self, dbname, user='user',
-                 password='password', host='localhost', port=5432, cleanup=True):
+                 password='password', host='localhost', port=5432, cleanup=True, shared=False, fast=False,
+                 metadata_cache=None):
         self.driver = 'postgresql'
-        if not self.__check_host(host, port):
+        self.shared = shared
+        # a cache opened from a path is closed with the Database
+        self.__own_cache = isinstance(metadata_cache, str)
+        self.metadata_cache = MetadataCache(metadata_cache) if self.__own_cache else metadata_cache
+        if not fast and not self.__check_host(host, port):
             sys.exit('Server not found!')
 
         # create dict, with which a URL to the db is created
@@ -70,10 +119,10 @@ class Database(object):
         # create engine, containing URL and driver
         log.debug('starting DB engine for {}'.format(URL(**self.url_dict)))
         self.url = URL(**self.url_dict)
-        self.engine = create_engine(self.url, echo=False)
+        self.engine = get_engine(self.url) if shared else create_engine(self.url, echo=False)
 
         # if database is new, (create postgres-db and) enable spatial extension
-        if not database_exists(self.engine.url):
+        if not fast and not database_exists(self.engine.url):
 
             log.debug('creating new PostgreSQL database')
             create_database(self.engine.url)
@@ -84,11 +133,12 @@ class Database(object):
             self.conn = self.engine.connect()
         # create Session (ORM) and get metadata
         self.Session = sessionmaker(bind=self.engine)
-        self.meta = MetaData(self.engine)
-        self.add_tables(tables_to_create())
-        # reflect tables from (by now) existing db, make some variables available within self
-        self.Base = automap_base(metadata=self.meta)
-        self.Base.prepare(self.engine, reflect=True)
+        # the schema is reflected on demand and cached until tables are added or dropped
+        self.__reset_schema_cache()
+        if not fast or self.get_schema_version() != schema_version():
+            self.add_tables(tables_to_create())
+            self.migrate()
+            self.__set_schema_version()
         self.dbname = dbname
 
         if cleanup:
@@ -97,6 +147,27 @@ class Database(object):
             sys.stdout.flush()
 
     # Table creation and addressing stuff
+    def __reset_schema_cache(self):
+        """
+        drop the cached schema (reflected tables, table names and automap classes),
+        it is reflected again on demand. Called after tables were added or dropped.
+        """
+        self.meta = MetaData(self.engine)
+        self.__tablenames = None
+        self.__base = None
+        self.__converters = None
+
+    @property
+    def Base(self):
+        """
+        automap base of the database tables, prepared on first use
+        """
+        if self.__base is None:
+            base = automap_base(metadata=self.meta)
+            base.prepare(self.engine, reflect=True)
+            self.__base = base
+        return self.__base
+
     def get_class_by_tablename(self, table):
         """Return class reference mapped to table.
         adapted from OrangeTux's comment on
@@ -127,7 +198,40 @@ class Database(object):
         -------
         sqlalchemy.Table
         """
-        return Table(table.lower(), self.meta, autoload=True, autoload_with=self.engine)
+        table = table.lower()
+        if table in self.meta.tables:
+            return self.meta.tables[table]
+        return Table(table, self.meta, autoload=True, autoload_with=self.engine)
+
+    def get_coltypes(self, table):
+        """
+        Return the column names and types of a table from the cached schema.
+
+        Parameters
+        ----------
+        table: str
+            tablename
+        Returns
+        -------
+        dict
+            column name -> column type
+        """
+        return {i.name: i.type for i in self.load_table(table).c}
+
+    def get_geometry_columns(self, table):
+        """
+        Return the names of the geometry columns of a table from the cached schema.
+
+        Parameters
+        ----------
+        table: str
+            tablename
+        Returns
+        -------
+        list
+            the geometry column names
+        """
+        return [i.name for i in self.load_table(table).c if isinstance(i.type, Geometry)]
 
     def add_tables(self, tables):
         """
@@ -140,21 +244,166 @@ class Database(object):
             The table(s) to be added to the database.
         """
         created = []
-        if isinstance(tables, list):
-            for table in tables:
-                table.metadata = self.meta
-                if not sql_inspect(self.engine).has_table(str(table)):
-                    table.create(self.engine)
-                    created.append(str(table))
-        else:
-            table = tables
+        if not isinstance(tables, list):
+            tables = [tables]
+        existing = self.get_tablenames(return_all=True)
+        for table in tables:
             table.metadata = self.meta
-            if not sql_inspect(self.engine).has_table(str(table)):
+            if str(table) not in existing:
                 table.create(self.engine)
                 created.append(str(table))
-        log.info('created table(s) {}.'.format(', '.join(created)))
-        self.Base = automap_base(metadata=self.meta)
-        self.Base.prepare(self.engine, reflect=True)
+        if len(created) > 0:
+            log.info('created table(s) {}.'.format(', '.join(created)))
+            self.__reset_schema_cache()
+
+    def get_schema_version(self):
+        """
+        Return the schema version stored in the database by the last construction of a :class:`Database`,
+        see :func:`schema_version`.
+
+        Returns
+        -------
+        str or None
+            None if no version is stored
+        """
+        with self.engine.connect() as conn:
+            if not self.engine.dialect.has_table(conn, 'schemainfo'):
+                return None
+            return conn.execute(text("SELECT value FROM schemainfo WHERE key = 'version'")).scalar()
+
+    def __set_schema_version(self):
+        """
+        store the current schema version in table schemainfo
+        """
+        schema_info = self.load_table('schemainfo')
+        statement = pg_insert(schema_info).values(key='version', value=schema_version())
+        statement = statement.on_conflict_do_update(index_elements=['key'],
+                                                    set_={'value': statement.excluded.value})
+        with self.engine.begin() as conn:
+            conn.execute(statement)
+        log.debug('stored schema version {}'.format(schema_version()))
+
+    def ensure_indexes(self, analyze=True):
+        """
+        Create the secondary indexes declared in :mod:`isos.database_tables` which are missing in the database,
+        e.g. for tables created by an earlier version. Geometry columns without index get a GiST index.
+
+        Parameters
+        ----------
+        analyze: bool
+            update the planner statistics of tables with new indexes
+
+        Returns
+        -------
+        list
+            the names of the created indexes
+        """
+        created = []
+        insp = sql_inspect(self.engine)
+        quote = self.engine.dialect.identifier_preparer.quote
+        existing = self.get_tablenames(return_all=True)
+        for table in tables_to_create():
+            if str(table) not in existing:
+                continue
+            indexes = insp.get_indexes(str(table))
+            names = [x['name'] for x in indexes]
+            indexed = [tuple(x['column_names']) for x in indexes]
+            new = []
+            for index in table.indexes:
+                if index.name not in names:
+                    index.create(self.engine)
+                    new.append(index.name)
+            for column in table.c:
+                if isinstance(column.type, Geometry) and (column.name,) not in indexed:
+                    name = 'idx_{}_{}'.format(table, column.name)
+                    with self.engine.begin() as conn:
+                        conn.execute(text('CREATE INDEX {} ON {} USING GIST ({})'.format(
+                            quote(name), quote(str(table)), quote(column.name))))
+                    new.append(name)
+            if analyze and len(new) > 0:
+                with self.engine.begin() as conn:
+                    conn.execute(text('ANALYZE {}'.format(quote(str(table)))))
+            created += new
+        if len(created) > 0:
+            log.info('created index(es) {}.'.format(', '.join(created)))
+        return created
+
+    def migrate(self):
+        """
+        Add the columns declared in :mod:`isos.database_tables` which are missing in existing tables,
+        e.g. of databases created by an earlier version. The derived columns of the registered scenes
+        are filled with :meth:`backfill` and the new columns are indexed with :meth:`ensure_indexes`.
+
+        Returns
+        -------
+        dict
+            table name -> names of the added columns
+        """
+        added = {}
+        quote = self.engine.dialect.identifier_preparer.quote
+        existing = self.get_tablenames(return_all=True)
+        for table in tables_to_create():
+            if str(table) not in existing:
+                continue
+            present = self.get_colnames(str(table))
+            new = []
+            for column in table.c:
+                if column.name in present:
+                    continue
+                if isinstance(column.type, Geometry):
+                    log.warning('geometry column {}.{} can not be added, recreate the table'.format(table, column.name))
+                    continue
+                # the full column DDL, including the expression of computed columns
+                with self.engine.begin() as conn:
+                    conn.execute(text('ALTER TABLE {} ADD COLUMN {}'.format(
+                        quote(str(table)), CreateColumn(column).compile(dialect=self.engine.dialect))))
+                new.append(column.name)
+            if len(new) > 0:
+                added[str(table)] = new
+        if len(added) > 0:
+            log.info('added column(s) {}.'.format(', '.join('{}.{}'.format(table, column)
+                                                           for table, columns in added.items()
+                                                           for column in columns)))
+            self.__reset_schema_cache()
+            for table in added.keys():
+                self.backfill(table)
+            self.ensure_indexes()
+        return added
+
+    def backfill(self, table):
+        """
+        Fill the columns derived from other columns (:data:`~isos.database_tables.timestamp_columns`)
+        and from the file names (:data:`~isos.database_tables.filename_columns`) of the entries of a table
+        in which they are empty. The values are computed by the database in a single UPDATE.
+
+        Parameters
+        ----------
+        table: str
+            tablename
+
+        Returns
+        -------
+        int
+            the number of updated entries
+        """
+        table_schema = self.load_table(table)
+        values = {}
+        for column, source in timestamp_columns.get(table, {}).items():
+            values[column] = cast(func.to_timestamp(table_schema.c[source], 'YYYYMMDD"T"HH24MISS'), DateTime)
+        for column, pattern in filename_columns.get(table, {}).items():
+            value = func.substring(table_schema.c.scene, pattern)
+            if isinstance(table_schema.c[column].type, Integer):
+                value = cast(value, Integer)
+            values[column] = value
+        if len(values) == 0:
+            return 0
+        query = table_schema.update() \
+            .where(or_(*[table_schema.c[column].is_(None) for column in values.keys()])) \
+            .values(**values)
+        with self.engine.begin() as conn:
+            count = conn.execute(query).rowcount
+        log.info('filled the derived columns of {} entries in table {}'.format(count, table))
+        return count
 
     def __check_table_exists(self, table):
         """
@@ -203,12 +452,14 @@ class Database(object):
             update = update.values(**args)
             return update
 
-    def __select_missing(self, table):
+    def __select_missing(self, table, workers=8):
         """
         Parameters
         ----------
         table: str
             Table to query
+        workers: int
+            number of threads checking the directories, see :func:`_missing_files`
         Returns
         -------
         list
@@ -218,9 +469,9 @@ class Database(object):
 
         scenes = self.Session().query(table_schema.c.scene)
         files = [self.encode(x[0]) for x in scenes]
-        return [x for x in files if not os.path.isfile(x)]
+        return _missing_files(files, workers)
 
-    def identify_sentinel2_from_folder(self, scene_dirs):
+    def identify_sentinel2_from_folder(self, scene_dirs, workers=1, backend='gdal'):
         """
         Method to open Sentinel-2 .zips with the vsizip in GDAL to read out metadata and ingest them in the
         table sentinel2data.
@@ -229,149 +480,173 @@ class Database(object):
         ----------
         scene_dirs: str or list of str
             list of Sentinel-2 zip paths
+        workers: int
+            number of threads reading the metadata files. The metadata is copied to dicts and the GDAL datasets
+            are closed right away, the dicts are converted as they come in.
+        backend: str
+            'gdal' to read the metadata files via GDAL's /vsizip/, 'zip' to read them with zipfile and an
+            incremental XML parser (same keys, see :func:`_read_s2_metadata_zip`)
 
         Returns
         -------
         list of dict
             orderly data from __refactor_sentinel2data
         """
-        metadata = []
-        tmp = os.environ.get('CPL_ZIP_ENCODING')
-        os.environ['CPL_ZIP_ENCODING'] = 'UTF-8'
+        if backend not in s2_readers:
+            raise ValueError("backend must be one of {}".format(', '.join(s2_readers)))
+        if backend == 'gdal':
+            os.environ['CPL_ZIP_ENCODING'] = 'UTF-8'
         if isinstance(scene_dirs, str):
             scene_dirs = [scene_dirs]
 
-        for filename in scene_dirs:
-            if filename.endswith('.incomplete'):
-                continue
-            name_dot_safe = Path(filename).stem + '.SAFE'
-            xml_file = None
-            if name_dot_safe[4:10] == 'MSIL2A':
-                xml_file = gdal.Open(
-                    '/vsizip/' + os.path.join(filename, name_dot_safe, 'MTD_MSIL2A.xml'))
-
-            elif name_dot_safe[4:10] == 'MSIL1C':
-                xml_file = gdal.Open(
-                    '/vsizip/' + os.path.join(filename, name_dot_safe, 'MTD_MSIL1C.xml'))
-            # this way we can open most raster formats and read metadata this way, just adjust the ifs..
-
-            if xml_file:
-                metadata.append([filename, xml_file])
-                xml_file = None
-        orderly_data = self.__refactor_sentinel2data(metadata)
+        scene_dirs = [x for x in scene_dirs if not x.endswith('.incomplete')]
+        if self.metadata_cache is None:
+            metadata = _imap_bounded(s2_readers[backend], scene_dirs, workers)
+            return self.__refactor_sentinel2data(x for x in metadata if x[1] is not None)
+        cached = self.metadata_cache.get('sentinel2data', scene_dirs)
+        missing = [x for x in scene_dirs if x not in cached]
+        read = [x for x in _imap_bounded(s2_readers[backend], missing, workers) if x[1] is not None]
+        self.metadata_cache.put('sentinel2data', read)
+        orderly_data = self.__refactor_sentinel2data(list(cached.items()) + read)
         return orderly_data
 
-    def parse_id(self, scenes):
+    def parse_id(self, scenes, workers=1, errors=None, executor=None):
         """
         Helper method to refactor Sentinel-1 id objects, make keys lower, replace ' ' by '_',
         make values the right unit types.
         ----------
         scenes: list of str
             s1 id objects
+        workers: int
+            number of processes reading the scenes in parallel. The parsed entries are collected in this process.
+        executor: concurrent.futures.ProcessPoolExecutor or None
+            a pool reading the scenes, kept over several calls to start the workers only once, see
+            :func:`_process_pool`. Default None: a pool of `workers` processes is started for this call.
+        errors: list or None
+            list to collect (scene, error message) of scenes that could not be parsed.
+            Default None: the failed scenes are logged.
         Returns
         -------
         list of dict
             reformatted data
+        Raises
+        ------
+        AttributeError
+            if a column of table sentinel1data is not found in the metadata, see :func:`_s1_entry`
         """
-        table_schema_cols = self.load_table('sentinel1data').c
-        coltypes = {}
-        for i in table_schema_cols:
-            coltypes[i.name] = i.type
-
-        orderly_data = []
+        columns = [x.name for x in self.load_table('sentinel1data').c if x.computed is None]
 
         if not isinstance(scenes, list):
             scenes = [scenes]
 
-        for scene in scenes:
-            if isinstance(scene, ID):
-                id = scene
-            else:
+        ids = [x for x in scenes if isinstance(x, ID)]
+        paths = [x for x in scenes if not isinstance(x, ID)]
+        cached = {} if self.metadata_cache is None else self.metadata_cache.get('sentinel1data', paths)
+        results = [(x, cached[x], None) for x in paths if x in cached]
+        paths = [x for x in paths if x not in cached]
+        read = [_read_s1_metadata(x) for x in ids]
+        if len(paths) > 1 and (executor is not None or workers > 1):
+            pool = executor or _process_pool(workers)
+            try:
+                chunksize = max(1, min(64, len(paths) // (max(workers, 1) * 4)))
+                read += list(pool.map(_read_s1_metadata, paths, chunksize=chunksize))
+            finally:
+                if executor is None:
+                    pool.shutdown()
+        else:
+            read += [_read_s1_metadata(x) for x in paths]
+        if self.metadata_cache is not None:
+            fresh = set(paths)
+            self.metadata_cache.put('sentinel1data', [(scene, metadata) for scene, metadata, error in read
+                                                      if metadata is not None and scene in fresh])
+        results += read
+
+        orderly_data = []
+        failed = []
+        for scene, metadata, error in results:
+            if metadata is not None:
+                # malformed metadata of a scene, a column without metadata source (AttributeError) is raised
                 try:
-                    id = identify(scene)
-                except RuntimeError:
-                    print(scene)
+                    orderly_data.append(_s1_entry(scene, metadata, columns))
                     continue
-
-            pols = [x.lower() for x in id.polarizations]
-
-            temp_dict = {}
-            for attribute in list(coltypes.keys()):
-                if attribute == 'outname_base':
-                    temp_dict[attribute] = id.outname_base()
-                elif attribute in ['bbox', 'geometry']:
-                    geom = getattr(id, attribute)()
-                    geom.reproject(4326)
-                    geom = geom.convert2wkt(set3D=False)[0]
-                    temp_dict[attribute] = 'SRID=4326;' + str(geom)
-                elif attribute in ['hh', 'vv', 'hv', 'vh']:
-                    temp_dict[attribute] = int(attribute in pols)
-                else:
-                    if hasattr(id, attribute):
-                        temp_dict[attribute] = getattr(id, attribute)
-                    elif attribute in id.meta.keys():
-                        temp_dict[attribute] = id.meta[attribute]
-                    else:
-                        raise AttributeError('could not find attribute {}'.format(attribute))
-            orderly_data.append(temp_dict)
+                except (KeyError, ValueError) as e:
+                    error = '{}: {}'.format(type(e).__name__, e)
+            failed.append((scene, error))
+        if errors is not None:
+            errors.extend(failed)
+        elif len(failed) > 0:
+            log.warning('The following scenes could not be parsed:\n{}'.format(
+                '\n'.join('{}: {}'.format(*x) for x in failed)))
         return orderly_data
 
     def __refactor_sentinel2data(self, metadata_as_list_of_dicts):
         """
         Helper method to refactor Sentinel-2 metadata dicts, make keys lower, replace ' ' by '_',
-        make values the right unit types. Add outname base from first field in list.
+        make values the right unit types (see :func:`_convert_metadata`). Add outname base from first field in list.
         Parameters
         ----------
-        metadata_as_list_of_dicts: list of [str, dict]
-            s2 metadata
+        metadata_as_list_of_dicts: iterable of [str, dict]
+            s2 scene and metadata
         Returns
         -------
         list of dict
             reformatted data
         """
-        # table_schema_cols = self.load_table('sentinel2data').c
-        # coltypes = {}
-        # for i in table_schema_cols:
-        #     coltypes[i.name] = i.type
-        coltypes = {i.name: i.type for i in self.load_table('sentinel2data').c}
+        coltypes = self.get_coltypes('sentinel2data')
+        table_schema = self.load_table('sentinel2data')
+        # compiled once per reflected schema, dropped with the schema cache
+        if self.__converters is None or self.__converters[0] is not table_schema:
+            self.__converters = (table_schema, _compile_converters(table_schema), {})
+        _, converters, keys = self.__converters
 
         orderly_data = []
-        for entry in metadata_as_list_of_dicts:
-            temp_dict = {}
-            for key, value in entry[1].GetMetadata().items():
-                key = key.lower().replace(' ', '_')
-                if str(coltypes.get(key)) == 'VARCHAR':
-                    temp_dict[key] = value
-                if str(coltypes.get(key)) == 'INTEGER':
-                    temp_dict[key] = int(value.replace('.0', ''))
-                if str(coltypes.get(key)) in ['DOUBLE PRECISION', 'FLOAT', 'DOUBLE_PRECISION']:
-                    temp_dict[key] = float(value)
-                if str(coltypes.get(key)) in ['TIMESTAMP', 'TIMESTAMP WITHOUT TIME ZONE', 'DATETIME']:
-                    if value != '' and value:
-                        try:
-                            temp_dict[key] = parser.parse(value)  # , '%Y-%m-%dT%H:%M:%SZ')
-                        except ValueError:
-                            try:
-                                temp_dict[key] = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ')
-                            except ValueError:
-                                print(entry)
-                                print(coltypes)
-                if str(coltypes.get(key)) in ['geometry(POLYGON,4326)']:
-                    temp_dict[key] = WKTElement(value, srid=4326)
-
-            temp_dict['outname_base'] = os.path.basename(entry[0])
-            temp_dict['scene'] = entry[0]
+        for scene, temp_dict in _convert_metadata(metadata_as_list_of_dicts, converters, keys):
+            temp_dict['outname_base'] = os.path.basename(scene)
+            temp_dict['scene'] = scene
+            temp_dict.update(_filename_fields('sentinel2data', scene, coltypes))
+            if 'metadata_level' in coltypes:
+                temp_dict['metadata_level'] = 'full'
             orderly_data.append(temp_dict)
         return orderly_data
 
-    def ingest_s1_from_id(self, scene_dirs, update=False, verbose=False):
-
-        orderly_data = self.parse_id(scene_dirs)
+    def ingest_s1_from_id(self, scene_dirs, update=False, verbose=False, workers=1, chunksize=1000):
+        """
+        ingest Sentinel-1 .zips into table sentinel1data.
 
-        self.insert(table='sentinel1data', primary_key=self.get_primary_keys('sentinel1data'),
-                    orderly_data=orderly_data, verbose=verbose, update=update)
+        Parameters
+        ----------
+        scene_dirs: str or list of str
+            list of Sentinel-1 zip paths
+        update: bool
+            update database? will update matching entries
+        verbose: bool
+            log additional info
+        workers: int
+            number of processes reading the scenes, see :meth:`parse_id`
+        chunksize: int
+            number of scenes parsed and committed at once, see :meth:`__ingest`
 
-    def ingest_s2_from_id(self, scene_dirs, update=False, verbose=False):
+        Returns
+        -------
+        list of tuple
+            (scene, error message) of the scenes that could not be parsed
+        """
+        errors = []
+        # the worker processes are started once for all chunks
+        executor = _process_pool(workers) if workers > 1 else None
+        try:
+            self.__ingest('sentinel1data', lambda x: self.parse_id(x, workers=workers, errors=errors,
+                                                                   executor=executor),
+                          scene_dirs, update, verbose, chunksize)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        if len(errors) > 0:
+            log.warning('{} scenes could not be parsed:\n{}'.format(
+                len(errors), '\n'.join('{}: {}'.format(*x) for x in errors)))
+        return errors
+
+    def ingest_s2_from_id(self, scene_dirs, update=False, verbose=False, workers=1, chunksize=1000, backend='gdal'):
         """
         ingest Sentinel-2 .zips into table sentinel2data.
 
@@ -383,16 +658,118 @@ class Database(object):
             update database? will update matching entries
         verbose: bool
             log additional info
+        workers: int
+            number of threads reading the metadata, see :meth:`identify_sentinel2_from_folder`
+        chunksize: int
+            number of scenes parsed and committed at once, see :meth:`__ingest`
+        backend: str
+            reader of the metadata files, 'gdal' or 'zip', see :meth:`identify_sentinel2_from_folder`
+
+        Returns
+        -------
+        """
+        self.__ingest('sentinel2data',
+                      lambda x: self.identify_sentinel2_from_folder(x, workers=workers, backend=backend),
+                      scene_dirs, update, verbose, chunksize)
+
+    def ingest_light(self, scene_dirs, chunksize=1000):
+        """
+        register Sentinel-1 and Sentinel-2 .zips in tables sentinel1data and sentinel2data with the fields encoded
+        in their file names only (sensor, mode, product, polarizations, start/stop time, orbit, data take, tile),
+        without opening the files. The entries are marked with metadata_level 'light' and are completed by the next
+        full ingest of the scenes, e.g. with :meth:`enrich`. Already registered scenes are not changed.
+
+        Parameters
+        ----------
+        scene_dirs: str or list of str
+            the scene paths, scenes with file names of other patterns are skipped
+        chunksize: int
+            number of entries committed at once
 
         Returns
         -------
+        dict
+            table -> number of registered scenes
         """
-        orderly_data = self.identify_sentinel2_from_folder(scene_dirs)
+        if isinstance(scene_dirs, str):
+            scene_dirs = [scene_dirs]
+        registered = {}
+        for table in light_patterns.keys():
+            entries = [x for x in (_light_entry(table, scene) for scene in scene_dirs) if x is not None]
+            if len(entries) > 0:
+                ret = self.insert(table=table, primary_key=self.get_primary_keys(table), orderly_data=entries,
+                                  update=False, bulk=True, chunksize=chunksize)
+                registered[table] = ret['inserted']
+        return registered
+
+    def enrich(self, table, workers=1, chunksize=1000):
+        """
+        full ingest of the scenes registered with :meth:`ingest_light`, replacing their entries
+
+        Parameters
+        ----------
+        table: str
+            sentinel1data or sentinel2data
+        workers: int
+            number of workers reading the scenes, see :meth:`ingest_s1_from_id` and :meth:`ingest_s2_from_id`
+        chunksize: int
+            number of scenes parsed and committed at once
+
+        Returns
+        -------
+        int
+            the number of scenes to enrich
+        """
+        table_schema = self.load_table(table)
+        with self.engine.connect() as conn:
+            scenes = [x[0] for x in conn.execute(select(table_schema.c.scene)
+                                                 .where(table_schema.c.metadata_level == 'light'))]
+        log.info('{} scenes to enrich in table {}'.format(len(scenes), table))
+        if len(scenes) > 0:
+            ingest = self.ingest_s1_from_id if table == 'sentinel1data' else self.ingest_s2_from_id
+            ingest(scenes, update=True, workers=workers, chunksize=chunksize)
+        return len(scenes)
+
+    def __ingest(self, table, parse, scene_dirs, update, verbose, chunksize):
+        """
+        Streaming ingest: the scenes are parsed chunk by chunk in a background thread, connected to the inserting
+        thread by a queue holding at most two parsed chunks. Every chunk is committed once inserted, so memory
+        stays bounded and the progress is kept if the ingest is interrupted.
 
-        self.insert(table='sentinel2data', primary_key=self.get_primary_keys('sentinel2data'),
-                    orderly_data=orderly_data, verbose=verbose, update=update)
+        Parameters
+        ----------
+        table: str
+            table to insert to
+        parse: function
+            converts a list of scenes to a list of entries of the table
+        scene_dirs: str or list of str
+            the scenes
+        update: bool
+            update database? will update matching entries
+        verbose: bool
+            log additional info
+        chunksize: int
+            number of scenes parsed and committed at once
 
-    def insert(self, table, primary_key, orderly_data, verbose=False, update=False):
+        Returns
+        -------
+        dict
+            the number of 'inserted', 'updated' and 'rejected' entries
+        """
+        if isinstance(scene_dirs, str):
+            scene_dirs = [scene_dirs]
+        # reflect the table before the parsing thread starts, the schema cache is not thread-safe
+        self.load_table(table)
+        primary_key = self.get_primary_keys(table)
+        counts = {'inserted': 0, 'updated': 0, 'rejected': 0}
+        for orderly_data in _prefetch(parse(chunk) for chunk in _ichunks(scene_dirs, chunksize)):
+            ret = self.insert(table=table, primary_key=primary_key, orderly_data=orderly_data,
+                              verbose=verbose, update=update, bulk=True, chunksize=chunksize)
+            for key, value in ret.items():
+                counts[key] += value
+        return counts
+
+    def insert(self, table, primary_key, orderly_data, verbose=False, update=False, bulk=False, chunksize=1000):
         """
         Generic insert for tables, checks if entry is already in db,
         update can be used to overwrite all concerning entries
@@ -408,68 +785,304 @@ class Database(object):
             log additional info
         update: bool
             update database? will update all entries given in orderly_data
-
+        bulk: bool
+            insert with set-based ``INSERT ... ON CONFLICT`` statements
+            instead of one existence check and commit per entry
+        chunksize: int
+            number of entries per statement and transaction in bulk mode
 
         Returns
         -------
-
+        dict
+            the number of 'inserted', 'updated' and 'rejected' entries
         """
+        counts = {'inserted': 0, 'updated': 0, 'rejected': 0}
         if len(orderly_data) == 0:
             log.info(f'no scenes found for table {table}!')
-            return
-
-        self.Base = automap_base(metadata=self.meta)
-        self.Base.prepare(self.engine, reflect=True)
+            return counts
 
         self.__check_table_exists(table)
         table_schema = self.load_table(table)
-        col_names = self.get_colnames(table)
-
-        reduce_entry = True if not set(col_names) == set(orderly_data[0].keys()) else False
-
-        session = self.Session()
+        # computed columns are filled by the database
+        col_names = [x.name for x in table_schema.c if x.computed is None]
         rejected = []
 
-        tableobj = self.Base.classes[table]
+        if bulk:
+            counts = self.__insert_bulk(table_schema, primary_key, orderly_data, col_names, update, chunksize)
+        else:
+            reduce_entry = True if not set(col_names) == set(orderly_data[0].keys()) else False
 
-        for entry in orderly_data:
-            if reduce_entry:
-                entry = {key: entry[key] for key in col_names if key in entry}
+            session = self.Session()
+            tableobj = self.Base.classes[table]
 
-            exists_str = exists()
-            for p_key in primary_key:
-                exists_str = exists_str.where(table_schema.c[p_key] == entry[p_key])
-            ret = session.query(exists_str).scalar()
+            for entry in orderly_data:
+                if reduce_entry:
+                    entry = {key: entry[key] for key in col_names if key in entry}
 
-            if ret:
-                if update:
-                    self.conn.execute(self.__prepare_update(table, primary_key, **entry))
-                rejected.append(entry)
-            else:
-                session.add(tableobj(**entry))
-                session.commit()
-        session.close()
-        message = 'Ingested {} entries to table {}'.format(len(orderly_data) - len(rejected), table)
-        if len(rejected) > 0:
-            if verbose:
-                if update:
-                    log.info('Updated entries with already existing primary key: ', rejected)
+                exists_str = exists()
+                for p_key in primary_key:
+                    exists_str = exists_str.where(table_schema.c[p_key] == entry[p_key])
+                ret = session.query(exists_str).scalar()
+
+                if ret:
+                    if update:
+                        self.conn.execute(self.__prepare_update(table, primary_key, **entry))
+                    rejected.append(entry)
                 else:
-                    log.info('Rejected entries with already existing primary key: ', rejected)
+                    session.add(tableobj(**entry))
+                    session.commit()
+            session.close()
+            counts['inserted'] = len(orderly_data) - len(rejected)
+            counts['updated' if update else 'rejected'] = len(rejected)
+
+        message = 'Ingested {} entries to table {}'.format(counts['inserted'], table)
+        if len(rejected) > 0 and verbose:
             if update:
-                message += ', updated {} (already existing).'.format(len(rejected))
+                log.info('Updated entries with already existing primary key: ', rejected)
             else:
-                message += ', rejected {} (already existing).'.format(len(rejected))
+                log.info('Rejected entries with already existing primary key: ', rejected)
+        if counts['updated'] > 0:
+            message += ', updated {} (already existing).'.format(counts['updated'])
+        if counts['rejected'] > 0:
+            message += ', rejected {} (already existing).'.format(counts['rejected'])
         log.info(message)
-        session.close()
+        return counts
+
+    def __insert_bulk(self, table_schema, primary_key, orderly_data, col_names, update, chunksize):
+        """
+        set-based insert of many entries with ``INSERT ... ON CONFLICT (primary key) DO UPDATE/DO NOTHING``.
+        Entries are grouped by their set of columns, so that an update only overwrites the given columns.
+        Entries with the same primary key are reduced to the last (update) or first (no update) one,
+        as with the per entry insert. Entries registered from the file name only (metadata_level 'light')
+        are always replaced by entries with full metadata.
+
+        Parameters
+        ----------
+        table_schema: sqlalchemy.Table
+            the table to insert to
+        primary_key: list of str
+            primary key of table within list, or combined key as list of keys
+        orderly_data: list of dicts
+            the entries
+        col_names: list of str
+            the column names of the table, other keys of the entries are ignored
+        update: bool
+            update already existing entries?
+        chunksize: int
+            number of entries per statement
+
+        Returns
+        -------
+        dict
+            the number of 'inserted', 'updated' and 'rejected' entries
+        """
+        valid = set(col_names)
+        unique = {}
+        for entry in orderly_data:
+            entry = {key: value for key, value in entry.items() if key in valid}
+            p_key = tuple(entry[x] for x in primary_key)
+            if update or p_key not in unique:
+                unique.pop(p_key, None)
+                unique[p_key] = entry
+
+        groups = {}
+        for entry in unique.values():
+            groups.setdefault(tuple(sorted(entry.keys())), []).append(entry)
+
+        counts = {'inserted': 0, 'updated': 0, 'rejected': 0}
+        for columns, entries in groups.items():
+            for chunk in _chunks(entries, chunksize):
+                statement = pg_insert(table_schema).values(chunk)
+                non_key = [x for x in columns if x not in primary_key]
+                if update and len(non_key) > 0:
+                    statement = statement.on_conflict_do_update(
+                        index_elements=primary_key,
+                        set_={x: statement.excluded[x] for x in non_key})
+                elif 'metadata_level' in columns and len(non_key) > 0:
+                    statement = statement.on_conflict_do_update(
+                        index_elements=primary_key,
+                        set_={x: statement.excluded[x] for x in non_key},
+                        where=and_(table_schema.c.metadata_level == 'light',
+                                   statement.excluded.metadata_level != 'light'))
+                else:
+                    statement = statement.on_conflict_do_nothing(index_elements=primary_key)
+                # each chunk is committed on its own, xmax is 0 for newly inserted rows,
+                # conflicting rows are only returned if updated
+                with self.engine.begin() as conn:
+                    inserted = [x[0] for x in conn.execute(statement.returning(literal_column('xmax = 0')))]
+                counts['inserted'] += sum(inserted)
+                counts['updated'] += len(inserted) - sum(inserted)
+                counts['rejected'] += len(chunk) - len(inserted)
+        counts['rejected' if not update else 'updated'] += len(orderly_data) - len(unique)
+        return counts
+
+    def enqueue_scenes(self, scenes, table, requeue=False):
+        """
+        add scenes to the ingest queue as pending. Scenes already in the queue keep their state,
+        unless `requeue` is set, or they were ingested before: their entries have been removed since,
+        e.g. by :meth:`drop_elements` or for a file deleted and downloaded again, so they are queued again.
+
+        Parameters
+        ----------
+        scenes: list of str
+            the scenes to be ingested
+        table: str
+            the table to ingest the scenes to
+        requeue: bool
+            reset already queued scenes to pending, e.g. for scenes changed since their ingestion
+
+        Returns
+        -------
+        int
+            the number of scenes set to pending
+        """
+        ingest_queue = self.load_table('ingestqueue')
+        queued = 0
+        for chunk in _chunks(list(scenes), 1000):
+            statement = pg_insert(ingest_queue).values([{'scene': x, 'target': table, 'state': 'pending',
+                                                         'attempts': 0} for x in chunk])
+            if requeue:
+                statement = statement.on_conflict_do_update(
+                    index_elements=['scene'],
+                    set_={'target': table, 'state': 'pending', 'attempts': 0, 'last_error': None,
+                          'updated': func.now()})
+            else:
+                statement = statement.on_conflict_do_update(
+                    index_elements=['scene'],
+                    set_={'target': table, 'state': 'pending', 'attempts': 0, 'last_error': None,
+                          'updated': func.now()},
+                    where=ingest_queue.c.state == 'ingested')
+            with self.engine.begin() as conn:
+                queued += conn.execute(statement).rowcount
+        return queued
+
+    def claim_scenes(self, table, limit=1000, max_attempts=3, stale_after=3600):
+        """
+        claim scenes of the ingest queue for this worker with ``SELECT ... FOR UPDATE SKIP LOCKED``,
+        so that workers running in parallel never get the same scene. Claimed scenes are set to parsing.
+        Claimable are pending scenes, failed scenes with less than `max_attempts` attempts and
+        scenes stuck in parsing for more than `stale_after` seconds, e.g. after a worker was killed.
+
+        Parameters
+        ----------
+        table: str
+            the table the scenes are ingested to
+        limit: int
+            maximum number of scenes to claim
+        max_attempts: int
+            maximum number of attempts to ingest a scene
+        stale_after: int
+            seconds after which a scene in state parsing can be claimed again
+
+        Returns
+        -------
+        list of str
+            the claimed scenes
+        """
+        ingest_queue = self.load_table('ingestqueue')
+        claimable = (ingest_queue.c.state == 'pending') | \
+                    ((ingest_queue.c.state == 'failed') & (ingest_queue.c.attempts < max_attempts)) | \
+                    ((ingest_queue.c.state == 'parsing') &
+                     (ingest_queue.c.updated < func.now() - timedelta(seconds=stale_after)))
+        # a locking CTE is evaluated once, unlike an IN subquery, which could claim more than `limit` scenes
+        claimed = select(ingest_queue.c.scene).where(ingest_queue.c.target == table, claimable). \
+            order_by(ingest_queue.c.created).limit(limit).with_for_update(skip_locked=True).cte('claimed')
+        statement = ingest_queue.update().where(ingest_queue.c.scene == claimed.c.scene). \
+            values(state='parsing', attempts=ingest_queue.c.attempts + 1, updated=func.now(),
+                   worker='{}:{}'.format(socket.gethostname(), os.getpid())). \
+            returning(ingest_queue.c.scene)
+        with self.engine.begin() as conn:
+            return [x[0] for x in conn.execute(statement)]
+
+    def update_queue(self, ingested=(), failed=()):
+        """
+        set the state of claimed scenes after their ingestion
+
+        Parameters
+        ----------
+        ingested: list of str
+            the successfully ingested scenes
+        failed: list of tuple
+            (scene, error message) of the scenes that could not be ingested
+
+        Returns
+        -------
+        """
+        ingest_queue = self.load_table('ingestqueue')
+        with self.engine.begin() as conn:
+            for chunk in _chunks(list(ingested)):
+                conn.execute(ingest_queue.update().where(ingest_queue.c.scene.in_(chunk)).values(
+                    state='ingested', last_error=None, updated=func.now()))
+            if len(failed) > 0:
+                conn.execute(ingest_queue.update().where(ingest_queue.c.scene == bindparam('b_scene')).values(
+                    state='failed', last_error=bindparam('b_error'), updated=func.now()),
+                    [{'b_scene': scene, 'b_error': error} for scene, error in failed])
+
+    def ingest_from_queue(self, table, update=False, verbose=False, workers=1, chunksize=1000,
+                          max_attempts=3, stale_after=3600):
+        """
+        ingest the queued scenes of a table chunk by chunk until no claimable scene is left.
+        Several workers, also on different nodes, can process the same queue at once, and a restarted
+        ingest continues where the last one stopped. See :meth:`enqueue_scenes` and :meth:`claim_scenes`.
+
+        Parameters
+        ----------
+        table: str
+            sentinel1data or sentinel2data
+        update: bool
+            update database? will update matching entries
+        verbose: bool
+            log additional info
+        workers: int
+            number of workers reading the scenes, see :meth:`parse_id` and :meth:`identify_sentinel2_from_folder`
+        chunksize: int
+            number of scenes claimed, parsed and committed at once
+        max_attempts: int
+            maximum number of attempts to ingest a scene
+        stale_after: int
+            seconds after which a scene in state parsing is considered abandoned
+
+        Returns
+        -------
+        dict
+            the number of 'ingested' and 'failed' scenes
+        """
+        primary_key = self.get_primary_keys(table)
+        counts = {'ingested': 0, 'failed': 0}
+        executor = _process_pool(workers) if workers > 1 and table == 'sentinel1data' else None
+        try:
+            while True:
+                scenes = self.claim_scenes(table, chunksize, max_attempts, stale_after)
+                if len(scenes) == 0:
+                    break
+                errors = []
+                if table == 'sentinel1data':
+                    orderly_data = self.parse_id(scenes, workers=workers, errors=errors, executor=executor)
+                else:
+                    orderly_data = self.identify_sentinel2_from_folder(scenes, workers=workers)
+                self.insert(table=table, primary_key=primary_key, orderly_data=orderly_data,
+                            verbose=verbose, update=update, bulk=True, chunksize=chunksize)
+                ingested = set(x['scene'] for x in orderly_data)
+                failed = set(x[0] for x in errors)
+                errors += [(x, 'metadata could not be read') for x in scenes
+                           if x not in ingested and x not in failed]
+                self.update_queue(ingested=ingested, failed=errors)
+                counts['ingested'] += len(ingested)
+                counts['failed'] += len(errors)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        log.info('Ingested {} queued scenes to table {}, {} failed.'.format(counts['ingested'], table,
+                                                                           counts['failed']))
+        return counts
 
     def is_registered(self, scene, table):
         """
-        Simple check if a scene is already registered in the database.
+        Simple check if a scene is already registered in the database, see :meth:`are_registered`.
         Parameters
         ----------
         scene: str or ID
-            the SAR scene
+            the scene path or file name
         table:
             from which table to check
         Returns
@@ -477,41 +1090,55 @@ class Database(object):
         bool
             is the scene already registered?
         """
-        try:
-            # not nice, try to determine s1 or s2 by name!
-            id = scene if isinstance(scene, ID) else identify(scene)
-            id = self.parse_id(id)[0]
-        except RuntimeError:
-            id = self.identify_sentinel2_from_folder(scene)[0]
-
-        self.__check_table_exists(table)
-        table_schema = self.load_table(table)
-        session = self.Session()
+        name = scene.scene if isinstance(scene, ID) else scene
+        return self.are_registered([name], table)[name]
 
-        primary_key = self.get_primary_keys(table)
+    def are_registered(self, scenes, table):
+        """
+        Check for many scenes at once whether they are registered in a table, with one query joining the scene list
+        with the table. Scenes given as path are looked up by path, scenes given as file name by file name
+        (column filename). The scenes are not opened.
 
-        exists_str = exists()
-        for p_key in primary_key:
-            exists_str = exists_str.where(table_schema.c[p_key] == id[p_key])
-        ret = session.query(exists_str).scalar()
-        session.close()
+        Parameters
+        ----------
+        scenes: list of str or ID
+            the scene paths or file names
+        table: str
+            from which table to check
 
-        if ret:
-            return True
-        return False
+        Returns
+        -------
+        dict
+            scene path or file name -> is the scene registered?
+        """
+        names = [x.scene if isinstance(x, ID) else x for x in scenes]
+        paths = sorted(set(x for x in names if os.path.dirname(x)))
+        basenames = sorted(set(x for x in names if not os.path.dirname(x)))
+        self.__check_table_exists(table)
+        with self.engine.connect() as conn:
+            registered = set(x[0] for x in conn.execute(_membership_query(self.load_table(table)),
+                                                        {'paths': paths, 'names': basenames}))
+        return {name: name in registered for name in names}
 
-    def cleanup(self):
+    def cleanup(self, workers=8):
         """
-        Remove all scenes from the database, which are no longer stored in their registered location
+        Remove all scenes from the database, which are no longer stored in their registered location.
+        The directories are listed once each and in parallel, the missing scenes are removed with one
+        statement per table.
+
+        Parameters
+        ----------
+        workers: int
+            number of threads checking the directories
         Returns
         -------
         """
         tables = self.get_tablenames()
         for table in tables:
-            missing = self.__select_missing(table)
+            missing = self.__select_missing(table, workers)
             for scene in missing:
-                log.info('Removing missing scene from database tables: {}'.format(scene))
-                self.drop_element(scene, table)
+                log.debug('Removing missing scene from database tables: {}'.format(scene))
+            self.drop_elements(missing, table)
 
     # misc methods
     @staticmethod
@@ -577,12 +1204,9 @@ class Database(object):
             if not isinstance(item, (ID, str)):
                 raise TypeError("items in scenelist must be of type 'str' or 'pyroSAR.ID'")
 
-        table_schema = self.load_table(table)
-        # ORM query, get all scenes locations
-        scenes_data = self.Session().query(table_schema.c.scene)
-        registered = [os.path.basename(self.encode(x[0])) for x in scenes_data]
-        names = [item.scene if isinstance(item, ID) else item for item in scenelist]
-        filtered = [x for x, y in zip(scenelist, names) if os.path.basename(y) not in registered]
+        names = [os.path.basename(item.scene if isinstance(item, ID) else item) for item in scenelist]
+        registered = self.are_registered(names, table)
+        filtered = [x for x, y in zip(scenelist, names) if not registered[y]]
         return filtered
 
     def get_colnames(self, table):
@@ -597,8 +1221,7 @@ class Database(object):
         list
             the column names of the chosen table
         """
-        dicts = sql_inspect(self.engine).get_columns(table)
-        col_names = [i['name'] for i in dicts]
+        col_names = [i.name for i in self.load_table(table).c]
 
         return sorted([self.encode(x) for x in col_names])
 
@@ -617,10 +1240,11 @@ class Database(object):
             the table names
         """
         #  the method was intended to only return user generated tables by default, as well as data and duplicates
-        all_tables = ['spatial_ref_sys']
+        all_tables = ['spatial_ref_sys'] + internal_tables
         # get tablenames from metadata
-        insp = sql_inspect(self.engine)
-        tables = sorted([self.encode(x) for x in insp.get_table_names()])
+        if self.__tablenames is None:
+            self.__tablenames = sorted([self.encode(x) for x in sql_inspect(self.engine).get_table_names()])
+        tables = list(self.__tablenames)
         if return_all:
             return tables
         else:
@@ -645,34 +1269,93 @@ class Database(object):
         """
         return [key.name for key in self.load_table(table).primary_key]
 
-    def get_unique_directories(self, table):
+    def get_scan_snapshot(self, directory):
         """
-        Get a list of directories containing registered scenes
+        Load the snapshot of the last incremental file search below a directory
 
         Parameters
         ----------
-        table: str
-            table name
+        directory: str
+            the searched directory
         Returns
         -------
-        list
-            the directory names
+        tuple of dict
+            directory -> modification time in ns and scene -> (size, modification time in ns, inode)
         """
-        # ORM query, get all directories
-        table = self.get_class_by_tablename(table)
-        scenes = self.Session().query(table.scene)
-        registered = [os.path.dirname(self.encode(x[0])) for x in scenes]
-        return list(set(registered))
+        directory = os.path.normpath(directory)
+        prefix = os.path.join(directory, '')
+        dirs = self.load_table('scandirectories')
+        files = self.load_table('scanfiles')
+        session = self.Session()
+        dir_snapshot = {x[0]: x[1] for x in session.query(dirs.c.directory, dirs.c.mtime_ns).filter(
+            (dirs.c.directory == directory) | dirs.c.directory.startswith(prefix, autoescape=True))}
+        file_snapshot = {x[0]: (x[1], x[2], x[3]) for x in session.query(
+            files.c.scene, files.c.file_size, files.c.mtime_ns, files.c.inode).filter(
+            (files.c.directory == directory) | files.c.directory.startswith(prefix, autoescape=True))}
+        session.close()
+        return dir_snapshot, file_snapshot
 
-    def move(self, table, scenelist, directory, pbar=False):
+    def update_scan_snapshot(self, directories, files, removed_directories=(), removed_files=()):
         """
-        Move a list of files while keeping the database entries up to date.
-        If a scene is registered in the database (in either the data or duplicates table),
-        the scene entry is directly changed to the new location.
+        Write the result of an incremental file search to the snapshot tables in one transaction
+
+        Parameters
+        ----------
+        directories: dict
+            new or changed directories, directory -> modification time in ns
+        files: dict
+            new or changed scenes, scene -> (size, modification time in ns, inode)
+        removed_directories: list of str
+            directories that no longer exist
+        removed_files: list of str
+            scenes that no longer exist
+
+        Returns
+        -------
+        """
+        dirs = self.load_table('scandirectories')
+        scans = self.load_table('scanfiles')
+        with self.engine.begin() as conn:
+            for chunk in _chunks(list(directories.keys()) + list(removed_directories)):
+                conn.execute(dirs.delete().where(dirs.c.directory.in_(chunk)))
+            for chunk in _chunks(list(files.keys()) + list(removed_files)):
+                conn.execute(scans.delete().where(scans.c.scene.in_(chunk)))
+            for chunk in _chunks(list(directories.items())):
+                conn.execute(dirs.insert(), [{'directory': key, 'mtime_ns': value} for key, value in chunk])
+            for chunk in _chunks(list(files.items())):
+                conn.execute(scans.insert(), [{'scene': key,
+                                                'directory': os.path.dirname(key),
+                                                'file_size': value[0],
+                                                'mtime_ns': value[1],
+                                                'inode': value[2]} for key, value in chunk])
+
+    def get_unique_directories(self, table):
+        """
+        Get a list of directories containing registered scenes
+
         Parameters
         ----------
         table: str
-            table to move scenes from
+            table name
+        Returns
+        -------
+        list
+            the directory names
+        """
+        # ORM query, get all directories
+        table = self.get_class_by_tablename(table)
+        scenes = self.Session().query(table.scene)
+        registered = [os.path.dirname(self.encode(x[0])) for x in scenes]
+        return list(set(registered))
+
+    def move(self, table, scenelist, directory, pbar=False):
+        """
+        Move a list of files while keeping the database entries up to date.
+        The entries of the scenes in all tables are changed to the new location, see :meth:`relocate`.
+        Parameters
+        ----------
+        table: str or None
+            deprecated, the entries are changed in all tables. A given table must exist, pass None to not check.
         scenelist: list
             the file locations
         directory: str
@@ -682,49 +1365,184 @@ class Database(object):
         Returns
         -------
         """
+        if table is not None:
+            warnings.warn('the table argument of Database.move is deprecated, the entries of the scenes are changed '
+                          'in all tables', DeprecationWarning, stacklevel=2)
+            if table not in self.get_tablenames(return_all=True):
+                raise ValueError('table {} does not exist'.format(table))
         if not os.path.isdir(directory):
             os.mkdir(directory)
         if not os.access(directory, os.W_OK):
             raise RuntimeError('directory cannot be written to')
-        failed = []
-        double = []
-        if pbar:
-            progress = pb.ProgressBar(max_value=len(scenelist)).start()
-        else:
-            progress = None
+        plan = [(scene, os.path.join(directory, os.path.basename(scene))) for scene in scenelist]
+        self.__relocate(plan, workers=1, verify=True, pbar=pbar)
 
-        for i, scene in enumerate(scenelist):
-            new = os.path.join(directory, os.path.basename(scene))
-            if os.path.isfile(new):
-                double.append(new)
-                continue
-            try:
-                shutil.move(scene, directory)
-            except shutil.Error:
-                failed.append(scene)
-                continue
-            finally:
-                if progress is not None:
-                    progress.update(i + 1)
-            if self.query_db(table=table, scene=scene) != 0:
-                table_name = table
+    def relocate(self, source, target, workers=4, verify=True, pbar=False):
+        """
+        Move all registered scenes below a directory to another directory keeping their relative paths,
+        e.g. to migrate between storage tiers. Files are renamed if possible, otherwise copied in parallel, verified
+        and removed. All path changes are written to the database in one transaction. The steps are recorded in table
+        movejournal, so an interrupted relocation is completed by :meth:`resume_relocation`, which runs first.
+
+        Parameters
+        ----------
+        source: str
+            the directory to move the scenes from
+        target: str
+            the directory to move the scenes to
+        workers: int
+            number of files copied at the same time
+        verify: bool
+            compare the content hashes of copies and source files before the sources are removed
+        pbar: bool
+            show a progress bar?
+
+        Returns
+        -------
+        dict
+            the number of 'renamed', 'copied', 'skipped' (target exists) and 'failed' scenes
+        """
+        source = os.path.normpath(source)
+        target = os.path.normpath(target)
+        prefix = source.rstrip('/') + '/'
+        scenes = set()
+        with self.engine.connect() as conn:
+            for table in self.__scene_tables():
+                table_schema = self.load_table(table)
+                query = select(table_schema.c.scene).where(table_schema.c.scene.startswith(prefix, autoescape=True))
+                scenes.update(x[0] for x in conn.execute(query))
+        plan = [(scene, os.path.join(target, os.path.relpath(scene, source))) for scene in sorted(scenes)]
+        return self.__relocate(plan, workers=workers, verify=verify, pbar=pbar)
+
+    def __scene_tables(self):
+        """
+        the tables with scene paths rewritten by :meth:`relocate`
+        """
+        return [x for x in self.get_tablenames(return_all=True)
+                if x not in ['movejournal', 'scanfiles'] and 'scene' in self.get_colnames(x)]
+
+    def __relocate(self, plan, workers, verify, pbar):
+        """
+        move scenes according to a plan of (old path, new path) and rewrite their paths in the database,
+        journaled in table movejournal, see :meth:`relocate`
+        """
+        self.resume_relocation()
+        journal = self.load_table('movejournal')
+        counts = {'renamed': 0, 'copied': 0, 'skipped': 0, 'failed': 0}
+        todo = []
+        for scene, new in plan:
+            if os.path.exists(new) or not os.path.isfile(scene):
+                log.info('skipping {}, not found or already existing at {}'.format(scene, new))
+                counts['skipped'] += 1
             else:
-                table_name = None
-            if table_name:
-                # using core connection to execute SQL syntax (as was before)
-                self.conn.execute('''UPDATE {0} SET scene= '{1}' WHERE scene='{2}' '''.format(table_name, new, scene))
+                todo.append((scene, new))
+        for chunk in _chunks(todo, 1000):
+            self.insert('movejournal', ['scene'], [{'scene': scene, 'target': new, 'state': 'planned'}
+                                                   for scene, new in chunk], update=True, bulk=True)
+
+        progress = pb.ProgressBar(max_value=len(todo)).start() if pbar else None
+        failed = []
+        transferred = []
+        results = _imap_bounded(lambda x: _transfer(x[0], x[1], verify), todo, workers)
+        for i, ((scene, new), (method, error)) in enumerate(zip(todo, results)):
+            if method is None:
+                failed.append('{}: {}'.format(scene, error))
+            else:
+                transferred.append({'b_scene': scene, 'b_method': method})
+                counts['renamed' if method == 'rename' else 'copied'] += 1
+            # planned entries are checked on disk when resuming, so the states can be written in batches
+            if len(transferred) >= 1000:
+                self.__set_transferred(transferred)
+                transferred = []
+            if progress is not None:
+                progress.update(i + 1)
+        self.__set_transferred(transferred)
         if progress is not None:
             progress.finish()
-
+        counts['failed'] = len(failed)
         if len(failed) > 0:
             log.info('The following scenes could not be moved:\n{}'.format('\n'.join(failed)))
-        if len(double) > 0:
-            log.info('The following scenes already exist at the target location:\n{}'.format('\n'.join(double)))
+            with self.engine.begin() as conn:
+                conn.execute(journal.delete().where(journal.c.state == 'planned'))
+        self.__commit_relocation()
+        log.info('relocated {renamed} scenes by renaming, {copied} by copying, '
+                 'skipped {skipped}, {failed} failed'.format(**counts))
+        return counts
+
+    def __set_transferred(self, entries):
+        """
+        set journal entries {'b_scene': scene, 'b_method': method} to state transferred
+        """
+        if len(entries) == 0:
+            return
+        journal = self.load_table('movejournal')
+        statement = journal.update().where(journal.c.scene == bindparam('b_scene')) \
+            .values(state='transferred', method=bindparam('b_method'))
+        with self.engine.begin() as conn:
+            conn.execute(statement, entries)
+
+    def __commit_relocation(self):
+        """
+        write the path changes of all transferred scenes of the journal to the database in one transaction,
+        then remove the sources of copied scenes and the journal entries
+        """
+        journal = self.load_table('movejournal')
+        with self.engine.begin() as conn:
+            for table in self.__scene_tables():
+                table_schema = self.load_table(table)
+                # entries of the new paths are outdated, there was no file before the transfer
+                conn.execute(table_schema.delete()
+                             .where(table_schema.c.scene == journal.c.target, journal.c.state == 'transferred'))
+                conn.execute(table_schema.update()
+                             .where(table_schema.c.scene == journal.c.scene, journal.c.state == 'transferred')
+                             .values(scene=journal.c.target))
+            conn.execute(journal.update().where(journal.c.state == 'transferred').values(state='committed'))
+        with self.engine.connect() as conn:
+            committed = conn.execute(select(journal.c.scene, journal.c.method)
+                                     .where(journal.c.state == 'committed')).fetchall()
+        for scene, method in committed:
+            if method == 'copy' and os.path.isfile(scene):
+                os.remove(scene)
+        with self.engine.begin() as conn:
+            conn.execute(journal.delete().where(journal.c.state == 'committed'))
+
+    def resume_relocation(self):
+        """
+        Complete a relocation interrupted before its journal was cleared, see :meth:`relocate`.
+        Scenes already at their new location are committed, the others stay at their old location.
+
+        Returns
+        -------
+        int
+            the number of scenes found in the journal
+        """
+        journal = self.load_table('movejournal')
+        with self.engine.connect() as conn:
+            planned = conn.execute(select(journal.c.scene, journal.c.target)
+                                   .where(journal.c.state == 'planned')).fetchall()
+            count = conn.execute(select(func.count()).select_from(journal)).scalar()
+        if count == 0:
+            return 0
+        log.info('resuming the relocation of {} scenes'.format(count))
+        transferred = []
+        for scene, new in planned:
+            if os.path.isfile(new):
+                # renamed, or copied and verified (the copy is renamed to its target last)
+                transferred.append({'b_scene': scene, 'b_method': 'copy' if os.path.isfile(scene) else 'rename'})
+            elif os.path.isfile(new + '.part'):
+                os.remove(new + '.part')
+        self.__set_transferred(transferred)
+        with self.engine.begin() as conn:
+            conn.execute(journal.delete().where(journal.c.state == 'planned'))
+        self.__commit_relocation()
+        return count
 
     def query_db(self, table, selected_columns='*', vectorobject=None, date=None, verbose=False, **args):
         """
-        select from the database, bases on pyrosar.Archive.select
-        todo make this working reliably maybe with select from sqlalchemy
+        select from the database, bases on pyrosar.Archive.select.
+        The query is built with SQLAlchemy Core and bound parameters, the geometry column is taken from the
+        cached schema.
+
         Parameters
         ----------
         table: str
@@ -733,13 +1551,17 @@ class Database(object):
             list of columns which should be returned by the query, default is all columns
         vectorobject: :class:`~spatialist.vector.Vector`
             a geometry with which the scenes need to overlap
-        date: str or list
-            either one date or a range from - to in a list
+        date: str, datetime or list
+            either one date, selecting the scenes acquired at that time, or a range from - to in a list,
+            see `mindate` and `maxdate`
         verbose: bool
             log additional info
         **args:
             any further arguments (columns), which are registered in the database.
-            See :meth:`~RCMArchive.archive.get_colnames()`
+            See :meth:`~RCMArchive.archive.get_colnames()`.
+            A list selects all given values. `scene` selects by full path or, given a file name only, by basename.
+            `mindate` and `maxdate` (str in format YYYYmmddTHHMMSS or datetime) select the scenes
+            acquired after/before, see :data:`date_columns`.
         Returns
         -------
         list
@@ -748,27 +1570,91 @@ class Database(object):
         # check if table exists
         if not self.__check_table_exists(table):
             return []
+        query = self.build_query(table, selected_columns, vectorobject, date, **args)
+        if verbose:
+            log.info(query.compile(self.engine, compile_kwargs={'literal_binds': True}))
+        # core SQL execution
+        query_rs = self.conn.execute(query)
+        return [dict(rowproxy._mapping) for rowproxy in query_rs]
 
-        # check if table is empty
-        if len([{column: value for column, value in rowproxy.items()}
-                for rowproxy in self.conn.execute('SELECT True FROM {} LIMIT 1;'.format(table))]) == 0:
-            log.info('Table {} is empty!'.format(table))
-            return []
-        col_names = self.get_colnames(table)
+    def query_db_iter(self, table, selected_columns='*', vectorobject=None, date=None, fetch_size=10000,
+                      output='dict', verbose=False, **args):
+        """
+        select from the database like :meth:`query_db`, but yield the results while they are fetched from a
+        server-side cursor, so that results of any size are processed with constant memory.
+        The query runs on an own connection, which is held until the iterator is exhausted or closed.
+
+        Parameters
+        ----------
+        table: str
+        selected_columns: list or str
+        vectorobject: :class:`~spatialist.vector.Vector`
+        date: str, datetime or list
+            see :meth:`query_db`
+        fetch_size: int
+            number of rows fetched from the server at once
+        output: str
+            - 'dict': one dict per row, as returned by :meth:`query_db`
+            - 'tuple': one tuple per row with the values of the selected columns
+            - 'numpy': one NumPy structured array per fetch. Integer columns that may be NULL are float with
+              NaN for NULL, time stamps datetime64 with NaT, geometries WKB bytes.
+            - 'arrow': one :class:`pyarrow.RecordBatch` per fetch, geometries as WKB
+        verbose: bool
+            log additional info
+        **args:
+            see :meth:`query_db`
+
+        Returns
+        -------
+        iterator
+            of dict, tuple, numpy.ndarray or pyarrow.RecordBatch
+        """
+        if output not in ['dict', 'tuple', 'numpy', 'arrow']:
+            raise ValueError("output must be one of 'dict', 'tuple', 'numpy' or 'arrow'")
+        if not self.__check_table_exists(table):
+            return iter([])
+        query = self.build_query(table, selected_columns, vectorobject, date, **args)
+        if verbose:
+            log.info(query.compile(self.engine, compile_kwargs={'literal_binds': True}))
+        if output in ['dict', 'tuple']:
+            convert = None
+        else:
+            convert = _batch_converter(list(query.selected_columns), output, self.get_geometry_columns(table))
+        return self.__stream(query, fetch_size, output, convert)
+
+    def __stream(self, query, fetch_size, output, convert):
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=fetch_size).execute(query)
+            for rows in result.partitions(fetch_size):
+                if output == 'dict':
+                    yield from (dict(row._mapping) for row in rows)
+                elif output == 'tuple':
+                    yield from (tuple(row) for row in rows)
+                else:
+                    yield convert(rows)
 
-        # here the geometry_columns table is queried, it has info about all tables' geometry columns
-        geom_list = [{column: value for column, value in rowproxy.items()}
-                     for rowproxy in self.conn.execute('SELECT f_table_name, f_geometry_column '
-                                                       'FROM geometry_columns;')]
-        geom_col_name = None
-        for entry in geom_list:
-            if table in entry.values():
-                geom_col_name = entry['f_geometry_column']
+    def build_query(self, table, selected_columns='*', vectorobject=None, date=None, **args):
+        """
+        build the select statement of :meth:`query_db`, e.g. for execution by another engine.
+        The arguments are those of :meth:`query_db`.
 
-        if isinstance(date, list):  # TODO: see how to query datetime. check if date exists
-            pass
-            # mindate = date[0]
-            # maxdate = date[1]
+        Returns
+        -------
+        sqlalchemy.sql.Select
+        """
+        table_schema = self.load_table(table)
+        col_names = self.get_colnames(table)
+        geometry_columns = self.get_geometry_columns(table)
+
+        start, stop = date_columns.get(table, (None, None))
+        if isinstance(date, (list, tuple)):
+            dates = [(date[0], start, '>='), (date[1], stop, '<=')]
+        elif date is not None:
+            # scenes acquired at the given time
+            dates = [(date, start, '<='), (date, stop, '>=')]
+        else:
+            dates = [(args.get('mindate'), start, '>='), (args.get('maxdate'), stop, '<=')]
+        args = {key: value for key, value in args.items() if key not in ['mindate', 'maxdate']}
 
         arg_valid = [x for x in args.keys() if x in col_names]
         arg_invalid = [x for x in args.keys() if x not in col_names]
@@ -776,61 +1662,82 @@ class Database(object):
             log.info('the following arguments will be ignored as they are not registered in the data base: {}'.format(
                      ', '.join(arg_invalid)))
 
-        if selected_columns != '*':
+        if selected_columns == '*':
+            selected_columns = [x.name for x in table_schema.c]
+        else:
             if isinstance(selected_columns, str):
                 selected_columns = [selected_columns]
+            selected_columns = [x.strip('"') for x in selected_columns]
             sel_col_invalid = [x for x in selected_columns if x not in col_names]
             if len(sel_col_invalid) > 0:
                 log.info('the following selected columns will be ignored '
                          'as they are not registered in the table: {}'.format(', '.join(sel_col_invalid)))
-        arg_format = []
-        vals = []
+            selected_columns = [x for x in selected_columns if x in col_names]
+        # geometries are returned as hex-encoded EWKB, as the database delivers them
+        columns = [type_coerce(table_schema.c[x], String).label(x) if x in geometry_columns else table_schema.c[x]
+                   for x in selected_columns]
 
+        conditions = []
         for key in arg_valid:
-            if key == 'scene':
-                arg_format.append('''scene LIKE '%%{0}%%' '''.format(os.path.basename(args[key])))
-            else:
-                if isinstance(args[key], (float, int, str)):
-                    arg_format.append('''{0}='{1}' '''.format(key, args[key]))
-                elif isinstance(args[key], (tuple, list)):
-                    arg_format.append('''{0} IN ('{1}')'''.format(key, "', '".join(map(str, args[key]))))
-            if key == 'mindate':
-                if re.search('[0-9]{8}T[0-9]{6}', args[key]):
-                    arg_format.append('start>=?')
-                    vals.append(args[key])
-                else:
-                    log.info('WARNING: argument mindate is ignored, must be in format YYYYmmddTHHMMSS')
-            if key == 'maxdate':
-                if re.search('[0-9]{8}T[0-9]{6}', args[key]):
-                    arg_format.append('stop<=?')
-                    vals.append(args[key])
+            column = table_schema.c[key]
+            value = args[key]
+            if key == 'scene' and isinstance(value, str):
+                if os.path.dirname(value):
+                    conditions.append(column == value)
+                elif 'filename' in table_schema.c:
+                    # indexed basename of the scene
+                    conditions.append(table_schema.c.filename == value)
+                elif table == 'sentinel1data':
+                    # outname_base holds the pyroSAR name of Sentinel-1 scenes, not the file name
+                    conditions.append(column.endswith('/' + value, autoescape=True))
                 else:
-                    log.info('WARNING: argument maxdate is ignored, must be in format YYYYmmddTHHMMSS')
+                    conditions.append(table_schema.c.outname_base == value)
+            elif isinstance(value, (tuple, list)):
+                conditions.append(column.in_(value))
+            else:
+                conditions.append(column == value)
 
-        if vectorobject and geom_col_name:
-            if isinstance(vectorobject, Vector):
+        for value, column, operator in dates:
+            if value is None:
+                continue
+            if column is None:
+                log.info('WARNING: date arguments are ignored, table {} has no date columns'.format(table))
+                continue
+            value = self.__parse_date(value, table_schema.c[column])
+            if value is None:
+                log.info('WARNING: date argument is ignored, must be in format YYYYmmddTHHMMSS')
+                continue
+            conditions.append(table_schema.c[column].op(operator)(value))
+
+        if vectorobject:
+            if isinstance(vectorobject, Vector) and len(geometry_columns) > 0:
                 vectorobject.reproject('+proj=longlat +datum=WGS84 +no_defs ')
                 site_geom = vectorobject.convert2wkt(set3D=False)[0]
-
-                arg_format.append("st_intersects({0}, 'SRID=4326; {1}')".format(
-                    geom_col_name,
-                    site_geom
-                ))
+                conditions.append(func.st_intersects(table_schema.c[geometry_columns[-1]],
+                                                     WKTElement(site_geom, srid=4326)))
             else:
                 log.info('WARNING: argument vectorobject is ignored, must be of type spatialist.vector.Vector. '
-                      'Check also if table has geom column!')
-
-        query = '''SELECT {} FROM {}'''.format(', '.join(selected_columns), table)
-        if len(arg_format) > 0:
-            query += ''' WHERE {}'''.format(' AND '.join(arg_format))
-        # the query gets assembled stepwise here
-        for val in vals:
-            query = query.replace('?', ''' '{0}' ''', 1).format(val)
-        if verbose:
-            log.info(query)
-        # core SQL execution
-        query_rs = self.conn.execute(query)
-        return [{column: value for column, value in rowproxy.items()} for rowproxy in query_rs]
+                         'Check also if table has geom column!')
+
+        return select(*columns).where(*conditions)
+
+    @staticmethod
+    def __parse_date(value, column):
+        """
+        convert a date given as datetime or str in format YYYYmmddTHHMMSS to the type of a date column
+
+        Returns
+        -------
+        datetime or str or None
+            None if the date could not be read
+        """
+        if isinstance(value, str):
+            if not re.search('^[0-9]{8}T[0-9]{6}$', value):
+                return None
+            value = datetime.strptime(value, '%Y%m%dT%H%M%S')
+        if isinstance(column.type, DateTime):
+            return value
+        return value.strftime('%Y%m%dT%H%M%S')
 
     @property
     def size(self):
@@ -888,6 +1795,101 @@ class Database(object):
         ret = self.Session().query(func.sum(self.load_table(table).c.read_permission))
         return ret.scalar()
 
+    def update_hashes(self, workers=8, chunksize=1000, blocksize=65536):
+        """
+        Update the duplicate index (table filehashes) of the readable scenes of tables existings1 and existings2.
+        Only new scenes and scenes whose size, modification time or inode changed are hashed, with a partial hash
+        of size, first and last block. Scenes sharing their partial hash are then hashed completely.
+        Scenes no longer listed in the exists tables are removed from the index.
+
+        Parameters
+        ----------
+        workers: int
+            number of threads reading the files
+        chunksize: int
+            number of hashes committed at once
+        blocksize: int
+            size of the first and last block in bytes
+
+        Returns
+        -------
+        dict
+            the number of scenes with new 'partial' and 'full' hashes and of 'removed' scenes
+        """
+        hashes = self.load_table('filehashes')
+        with self.engine.connect() as conn:
+            scenes = set()
+            for table in ['existings1', 'existings2']:
+                table_schema = self.load_table(table)
+                query = select(table_schema.c.scene).where(table_schema.c.read_permission == 1)
+                scenes.update(x[0] for x in conn.execute(query))
+            cached = {x[0]: tuple(x[1:]) for x in conn.execute(
+                select(hashes.c.scene, hashes.c.file_size, hashes.c.mtime_ns, hashes.c.inode))}
+        counts = {'partial': 0, 'full': 0,
+                  'removed': self.drop_elements([x for x in cached.keys() if x not in scenes], 'filehashes')}
+        scenes = sorted(scenes)
+
+        def changed(scene):
+            try:
+                st = os.stat(scene)
+            except OSError:
+                return False
+            return cached.get(scene) != (st.st_size, st.st_mtime_ns, st.st_ino)
+
+        todo = (scene for scene, flag in zip(scenes, _imap_bounded(changed, scenes, workers)) if flag)
+        for chunk in _ichunks(todo, chunksize):
+            entries = [x for x in _imap_bounded(lambda x: _partial_hash(x, blocksize), chunk, workers)
+                       if x is not None]
+            if len(entries) > 0:
+                self.insert('filehashes', ['scene'], entries, update=True, bulk=True, chunksize=chunksize)
+                counts['partial'] += len(entries)
+
+        shared = select(hashes.c.partial_hash).group_by(hashes.c.partial_hash).having(func.count() > 1)
+        with self.engine.connect() as conn:
+            collisions = [x[0] for x in conn.execute(
+                select(hashes.c.scene).where(hashes.c.full_hash.is_(None), hashes.c.partial_hash.in_(shared)))]
+        statement = hashes.update().where(hashes.c.scene == bindparam('b_scene')) \
+            .values(full_hash=bindparam('b_full_hash'))
+        for chunk in _chunks(collisions, chunksize):
+            entries = [{'b_scene': scene, 'b_full_hash': digest}
+                       for scene, digest in zip(chunk, _imap_bounded(_full_hash, chunk, workers))
+                       if digest is not None]
+            if len(entries) > 0:
+                with self.engine.begin() as conn:
+                    conn.execute(statement, entries)
+                counts['full'] += len(entries)
+        log.info('hashed {partial} new or changed scenes, {full} completely, '
+                 'removed {removed} from the duplicate index'.format(**counts))
+        return counts
+
+    def find_duplicates(self):
+        """
+        Report the scenes with identical content from the duplicate index, see :meth:`update_hashes`.
+
+        Returns
+        -------
+        dict
+            'groups': lists of scenes with identical content,
+            'copies': number of redundant copies (all but one per group),
+            'bytes': combined size of all scenes in the groups,
+            'redundant_bytes': combined size of the redundant copies
+        """
+        hashes = self.load_table('filehashes')
+        query = select(func.array_agg(aggregate_order_by(hashes.c.scene, hashes.c.scene)),
+                       func.max(hashes.c.file_size)) \
+            .where(hashes.c.full_hash.isnot(None)) \
+            .group_by(hashes.c.full_hash) \
+            .having(func.count() > 1)
+        out = {'groups': [], 'copies': 0, 'bytes': 0, 'redundant_bytes': 0}
+        with self.engine.connect() as conn:
+            for scenes, file_size in conn.execute(query):
+                out['groups'].append(scenes)
+                out['copies'] += len(scenes) - 1
+                out['bytes'] += file_size * len(scenes)
+                out['redundant_bytes'] += file_size * (len(scenes) - 1)
+        out['groups'].sort()
+        return out
+
     # Database utilities
     def __enter__(self):
         return self
@@ -898,6 +1900,11 @@ class Database(object):
         """
         self.Session().close()
         self.conn.close()
+        if self.__own_cache:
+            self.metadata_cache.close()
+        if self.shared:
+            # the pooled engine stays open for other Database objects, see dispose_engines
+            return
         self.engine.dispose()
         gc.collect(generation=2)  # this was added as a fix for win PermissionError when deleting sqlite.db files.
 
@@ -926,6 +1933,33 @@ class Database(object):
 
         log.info('Entry with scene-id: \n{} \nwas dropped from data!'.format(scene))
 
+    def drop_elements(self, scenes, table):
+        """
+        Drop a list of scenes from a table with one set-based ``DELETE ... WHERE scene = ANY(:scenes)`` statement.
+
+        Parameters
+        ----------
+        scenes: list of str
+            paths of scenes
+        table: str
+            name of table to drop elements from
+        Returns
+        -------
+        int
+            the number of dropped entries
+        """
+        scenes = list(scenes)
+        if len(scenes) == 0:
+            return 0
+        table_schema = self.load_table(table)
+        statement = table_schema.delete().where(
+            table_schema.c.scene == any_(bindparam('scenes', type_=ARRAY(String))))
+        with self.engine.begin() as conn:
+            dropped = conn.execute(statement, {'scenes': scenes}).rowcount
+        if dropped > 0:
+            log.info('{} entries were dropped from table {}'.format(dropped, table))
+        return dropped
+
     def drop_table(self, table):
         """
         Drop a table from the database.
@@ -946,9 +1980,7 @@ class Database(object):
             log.info('table {} dropped from database.'.format(table_schema))
         else:
             raise ValueError("table {} is not registered in the database!".format(table))
-        self.meta = MetaData(self.engine)
-        self.Base = automap_base(metadata=self.meta)
-        self.Base.prepare(self.engine, reflect=True)
+        self.__reset_schema_cache()
 
     @staticmethod
     def __is_open(ip, port):
@@ -1001,6 +2033,96 @@ class Database(object):
         return ipup
 
 
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(url, pool_size=5, max_overflow=10):
+    """
+    Return the engine shared by all :class:`Database` objects of this process connecting to the same URL.
+    It is created on first use with a connection pool, whose connections are tested before they are handed out.
+
+    Parameters
+    ----------
+    url: sqlalchemy.engine.url.URL
+        the database URL
+    pool_size: int
+        number of connections kept open
+    max_overflow: int
+        number of additional connections opened under load
+
+    Returns
+    -------
+    sqlalchemy.engine.Engine
+    """
+    with _engines_lock:
+        if url not in _engines:
+            _engines[url] = create_engine(url, echo=False, pool_size=pool_size, max_overflow=max_overflow,
+                                          pool_pre_ping=True)
+        return _engines[url]
+
+
+def dispose_engines():
+    """
+    close the connections of all shared engines, see :func:`get_engine`
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def database_factory(dbname, user='user', password='password', host='localhost', port=5432):
+    """
+    Return a function creating :class:`Database` objects on the shared, pooled engine of the database,
+    for pipeline stages and long running services opening the database repeatedly.
+    The objects are constructed in fast mode without cleanup, the schema is only checked and created
+    if its version in the database is not the current one.
+
+    Parameters
+    ----------
+    dbname: str
+        The name for the PostgreSQL database.
+    user: str
+    password: str
+    host: str
+    port: int
+
+    Returns
+    -------
+    function
+        creates a :class:`Database`, keyword arguments of :class:`Database` can be given
+
+    Examples
+    --------
+    >>> open_db = database_factory('isos_db', user='user', password='password')
+    >>> with open_db() as db:
+    >>>     db.count_scenes('sentinel1data')
+    """
+    def open_database(**kwargs):
+        options = {'cleanup': False, 'shared': True, 'fast': True}
+        options.update(kwargs)
+        return Database(dbname, user=user, password=password, host=host, port=port, **options)
+    return open_database
+
+
+def schema_version():
+    """
+    Fingerprint of the tables, columns and indexes declared in :mod:`isos.database_tables`,
+    stored in the database by :class:`Database` to skip the schema checks in fast mode.
+
+    Returns
+    -------
+    str
+    """
+    parts = []
+    for table in sorted(tables_to_create(), key=str):
+        parts.append(str(table))
+        parts += ['{} {}'.format(column.name, column.type) for column in table.c]
+        parts += sorted(index.name for index in table.indexes)
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+
 def drop_archive(database):
     """
     drop (delete) a scene database
@@ -1026,9 +2148,720 @@ def drop_archive(database):
     """
     url = database.url
     database.close()
+    if database.shared:
+        # the pooled connections of a shared engine would block dropping the database
+        with _engines_lock:
+            _engines.pop(url, None)
+        database.engine.dispose()
     drop_database(url)
 
 
+def _read_s2_metadata(filename):
+    """
+    read the metadata of a Sentinel-2 .zip from its MTD_MSIL2A.xml or MTD_MSIL1C.xml file via GDAL's /vsizip/
+
+    Parameters
+    ----------
+    filename: str
+        the Sentinel-2 zip path
+
+    Returns
+    -------
+    tuple
+        the filename and the metadata as dict, or None if it could not be read
+    """
+    name_dot_safe = Path(filename).stem + '.SAFE'
+    xml_file = None
+    if name_dot_safe[4:10] == 'MSIL2A':
+        xml_file = gdal.Open(
+            '/vsizip/' + os.path.join(filename, name_dot_safe, 'MTD_MSIL2A.xml'))
+
+    elif name_dot_safe[4:10] == 'MSIL1C':
+        xml_file = gdal.Open(
+            '/vsizip/' + os.path.join(filename, name_dot_safe, 'MTD_MSIL1C.xml'))
+    # this way we can open most raster formats and read metadata this way, just adjust the ifs..
+
+    if not xml_file:
+        return filename, None
+    metadata = dict(xml_file.GetMetadata())
+    xml_file = None
+    return filename, metadata
+
+
+def _read_s2_metadata_zip(filename):
+    """
+    read the metadata of a Sentinel-2 .zip like :func:`_read_s2_metadata`, with the same keys as GDAL's SENTINEL2
+    driver, but without GDAL: only the central directory of the zip and the MTD_MSIL2A.xml or MTD_MSIL1C.xml member
+    are read, the member is streamed through an incremental XML parser. Thread safe, other than GDAL's /vsizip/ which
+    needs the process wide CPL_ZIP_ENCODING.
+
+    Parameters
+    ----------
+    filename: str
+        the Sentinel-2 zip path
+
+    Returns
+    -------
+    tuple
+        the filename and the metadata as dict, or None if it could not be read
+    """
+    name_dot_safe = Path(filename).stem + '.SAFE'
+    if name_dot_safe[4:10] not in ['MSIL2A', 'MSIL1C']:
+        return filename, None
+    member = '{}/MTD_{}.xml'.format(name_dot_safe, name_dot_safe[4:10])
+    try:
+        with zipfile.ZipFile(filename) as archive, archive.open(member) as xml_file:
+            return filename, _parse_s2_metadata(xml_file)
+    except (OSError, KeyError, zipfile.BadZipFile, ElementTree.ParseError) as e:
+        log.debug('could not read {}: {}'.format(filename, e))
+        return filename, None
+
+
+def _parse_s2_metadata(xml_file):
+    """
+    collect the metadata of a Sentinel-2 user product MTD file as done by GDAL's SENTINEL2 driver
+    (SENTINEL2GetUserProductMetadata and the FOOTPRINT item), elements are discarded once processed
+
+    Parameters
+    ----------
+    xml_file: file-like object
+
+    Returns
+    -------
+    dict
+    """
+    metadata = {}
+    path = []
+    datatakes = 0
+    special_value = {}
+    for event, elem in ElementTree.iterparse(xml_file, events=('start', 'end')):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if event == 'start':
+            path.append(tag)
+            if tag == 'Datatake' and tuple(path[-3:-1]) in s2_product_info:
+                datatakes += 1
+                if 'datatakeIdentifier' in elem.attrib:
+                    metadata['DATATAKE_{}_ID'.format(datatakes)] = elem.attrib['datatakeIdentifier']
+            continue
+        path.pop()
+        parents = tuple(path[-3:])
+        text = elem.text if len(elem) == 0 else None
+        plain = text is not None and not elem.attrib
+        if parents[-2:] in s2_product_info:
+            if plain:
+                metadata[tag] = text
+        elif parents[-1:] == ('Datatake',) and parents[-3:-1] in s2_product_info:
+            if plain:
+                metadata['DATATAKE_{}_{}'.format(datatakes, tag)] = text
+        elif parents[-2:] in s2_image_characteristics:
+            if tag == 'QUANTIFICATION_VALUE' and text is not None:
+                metadata[tag] = text
+            elif tag == 'REFERENCE_BAND' and text is not None and text.strip().isdigit() \
+                    and int(text) < len(s2_bands):
+                metadata[tag] = s2_bands[int(text)]
+            elif tag == 'Special_Values':
+                if 'SPECIAL_VALUE_TEXT' in special_value and 'SPECIAL_VALUE_INDEX' in special_value:
+                    metadata['SPECIAL_VALUE_' + special_value['SPECIAL_VALUE_TEXT']] = \
+                        special_value['SPECIAL_VALUE_INDEX']
+                special_value = {}
+        elif parents[-1:] == ('Special_Values',) and text is not None:
+            special_value[tag] = text
+        elif parents[-1:] == ('Reflectance_Conversion',) and tag == 'U' and text is not None:
+            metadata['REFLECTANCE_CONVERSION_U'] = text
+        elif parents[-1:] in [('QUANTIFICATION_VALUES_LIST',), ('Quantification_Values_List',)]:
+            if text is not None:
+                metadata[tag] = text
+            if 'unit' in elem.attrib:
+                metadata[tag + '_UNIT'] = elem.attrib['unit']
+        elif parents[-1:] == ('Quality_Indicators_Info',) and tag == 'Cloud_Coverage_Assessment':
+            if text is not None:
+                metadata['CLOUD_COVERAGE_ASSESSMENT'] = text
+        elif parents[-2:] == ('Quality_Indicators_Info', 'Technical_Quality_Assessment'):
+            if tag in ['DEGRADED_ANC_DATA_PERCENTAGE', 'DEGRADED_MSI_DATA_PERCENTAGE'] and text is not None:
+                metadata[tag] = text
+        elif parents[-1:] == ('Quality_Inspections',):
+            if text is not None and elem.attrib:
+                # L2A: <quality_check checkType="GENERAL_QUALITY">PASSED</quality_check>
+                metadata[next(iter(elem.attrib.values()))] = text
+            elif plain:
+                metadata[tag] = text
+        elif parents[-1:] == ('Image_Content_QI',) and parents[-2:-1] in [('Quality_Indicators_Info',),
+                                                                          ('L2A_Quality_Indicators_Info',)]:
+            if plain:
+                metadata[tag] = text
+        elif tag == 'EXT_POS_LIST' and parents == ('Product_Footprint', 'Product_Footprint', 'Global_Footprint'):
+            footprint = _footprint_wkt(text or '')
+            if footprint is not None:
+                metadata['FOOTPRINT'] = footprint
+        elem.clear()
+    return metadata
+
+
+def _footprint_wkt(pos_list):
+    """
+    WKT polygon from a GML position list of lat lon (height) coordinates, as GDAL's SENTINEL2GetPolygonWKTFromPosList
+    """
+    tokens = pos_list.split()
+    dim = 2
+    if len(tokens) % 3 == 0 and len(tokens) >= 12 and tokens[:3] == tokens[-3:]:
+        dim = 3
+    if len(tokens) == 0 or len(tokens) % dim != 0:
+        return None
+    points = [' '.join([tokens[i + 1], tokens[i]] + tokens[i + 2:i + dim]) for i in range(0, len(tokens), dim)]
+    return 'POLYGON(({}))'.format(', '.join(points))
+
+
+# readers of the Sentinel-2 metadata, see Database.identify_sentinel2_from_folder
+s2_readers = {'gdal': _read_s2_metadata, 'zip': _read_s2_metadata_zip}
+
+
+def _imap_bounded(function, iterable, workers, buffersize=None):
+    """
+    map a function over an iterable in a thread pool, yielding the results in order
+    while keeping at most `buffersize` (default: two per worker) items in flight
+    """
+    if workers <= 1:
+        yield from map(function, iterable)
+        return
+    buffersize = buffersize or workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= buffersize:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _process_pool(workers):
+    """
+    a pool of processes for :func:`_read_s1_metadata`. Forking a process that runs other threads (see
+    :meth:`Database.__ingest`) is unsafe, the workers are started from a clean process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def _read_s1_metadata(scene):
+    """
+    read a Sentinel-1 scene with :func:`pyroSAR.drivers.identify`: the scalar metadata values and lists of them,
+    the outname base and the bounding box and footprint as EWKT, all serializable to JSON for the metadata cache.
+    Runs in worker processes of :meth:`Database.parse_id`, so only picklable objects are returned.
+
+    Parameters
+    ----------
+    scene: str or ID
+        the scene
+
+    Returns
+    -------
+    tuple
+        the scene, the metadata as dict or None, and the error message or None
+    """
+    name = scene.scene if isinstance(scene, ID) else scene
+    try:
+        id = scene if isinstance(scene, ID) else identify(scene)
+        metadata = {}
+        for key, value in id.meta.items():
+            if isinstance(value, (list, tuple)) and all(isinstance(x, _scalar_types) for x in value):
+                metadata[key] = list(value)
+            elif isinstance(value, _scalar_types):
+                metadata[key] = value
+        metadata['scene'] = id.scene
+        metadata['outname_base'] = id.outname_base()
+        for attribute in ['bbox', 'geometry']:
+            geom = getattr(id, attribute)()
+            geom.reproject(4326)
+            metadata[attribute] = 'SRID=4326;' + str(geom.convert2wkt(set3D=False)[0])
+    except Exception as e:
+        return name, None, '{}: {}'.format(type(e).__name__, e)
+    return name, metadata, None
+
+
+_scalar_types = (str, int, float, bool, type(None))
+
+
+def _s1_entry(scene, metadata, columns):
+    """
+    convert the metadata of a Sentinel-1 scene read by :func:`_read_s1_metadata` to an entry of table sentinel1data
+
+    Parameters
+    ----------
+    scene: str
+        the scene path
+    metadata: dict
+        the metadata
+    columns: list of str
+        the column names of table sentinel1data
+
+    Returns
+    -------
+    dict
+        the entry
+
+    Raises
+    ------
+    AttributeError
+        if a column is not found in the metadata
+    """
+    pols = [x.lower() for x in metadata['polarizations']]
+    temp_dict = {}
+    for attribute in columns:
+        if attribute in ['hh', 'vv', 'hv', 'vh']:
+            temp_dict[attribute] = int(attribute in pols)
+        elif attribute in timestamp_columns['sentinel1data']:
+            source = timestamp_columns['sentinel1data'][attribute]
+            temp_dict[attribute] = datetime.strptime(metadata[source], '%Y%m%dT%H%M%S')
+        elif attribute in filename_columns['sentinel1data']:
+            continue
+        elif attribute == 'metadata_level':
+            temp_dict[attribute] = 'full'
+        elif attribute in metadata:
+            temp_dict[attribute] = metadata[attribute]
+        else:
+            raise AttributeError('could not find attribute {}'.format(attribute))
+    temp_dict.update(_filename_fields('sentinel1data', scene, columns))
+    return temp_dict
+
+
+def _light_entry(table, scene):
+    """
+    create an entry of table sentinel1data or sentinel2data from the file name of a scene, see
+    :meth:`Database.ingest_light`
+
+    Parameters
+    ----------
+    table: str
+        sentinel1data or sentinel2data
+    scene: str
+        the scene path
+
+    Returns
+    -------
+    dict or None
+        the entry, None if the file name does not match the pattern of the table
+    """
+    match = light_patterns[table].search(os.path.basename(scene))
+    if match is None:
+        return None
+    fields = match.groupdict()
+    start = datetime.strptime(fields['start'], '%Y%m%dT%H%M%S')
+    if table == 'sentinel1data':
+        pols = fields['polarization']
+        pols = {'SH': ['hh'], 'SV': ['vv'], 'DH': ['hh', 'hv'], 'DV': ['vv', 'vh']}.get(pols, [pols.lower()])
+        orbit_abs = int(fields['orbitNumber_abs'])
+        # relative orbit from the absolute orbit, offsets of the first orbits of the 175 orbit cycle
+        offset = {'S1A': 73, 'S1B': 27}[fields['sensor']]
+        entry = {'sensor': fields['sensor'],
+                 'acquisition_mode': fields['acquisition_mode'],
+                 'product': fields['product'],
+                 'start': fields['start'],
+                 'stop': fields['stop'],
+                 'start_time': start,
+                 'stop_time': datetime.strptime(fields['stop'], '%Y%m%dT%H%M%S'),
+                 'orbitNumber_abs': orbit_abs,
+                 'orbitNumber_rel': (orbit_abs - offset) % 175 + 1,
+                 'datatake_id': fields['datatake_id'],
+                 'product_unique_id': fields['product_unique_id']}
+        entry.update({x: int(x in pols) for x in ['hh', 'vv', 'hv', 'vh']})
+        # the orbit direction is not in the file name, orbit and outname_base are left to the full ingest
+    else:
+        level = fields['level']
+        entry = {'outname_base': os.path.basename(scene),
+                 'product_uri': Path(scene).stem + '.SAFE',
+                 'product_type': 'S2MSI' + level[1:],
+                 'processing_level': 'Level-' + level[1:],
+                 'processing_baseline': int(fields['baseline']) / 100,
+                 'product_start_time': start,
+                 'datatake_1_spacecraft_name': 'Sentinel-' + fields['sensor'][1:],
+                 'mgrs_tile': fields['mgrs_tile'],
+                 'relative_orbit': int(fields['relative_orbit'])}
+    entry['scene'] = scene
+    entry['metadata_level'] = 'light'
+    return entry
+
+
+def _membership_query(table_schema):
+    """
+    statement selecting those of the scene paths (parameter `paths`) and file names (parameter `names`)
+    registered in a table, with semi-joins of the unnested parameter arrays and the table,
+    see :meth:`Database.are_registered`
+    """
+    if 'filename' in table_schema.c:
+        basename = table_schema.c.filename
+    else:
+        basename = func.regexp_replace(table_schema.c.scene, '^.*/', '')
+    paths = func.unnest(bindparam('paths', type_=ARRAY(String))).table_valued('value').alias('paths')
+    names = func.unnest(bindparam('names', type_=ARRAY(String))).table_valued('value').alias('names')
+    return union_all(select(paths.c.value).where(exists().where(table_schema.c.scene == paths.c.value)),
+                     select(names.c.value).where(exists().where(basename == names.c.value)))
+
+
+def _transfer(scene, target, verify=True):
+    """
+    move a file by renaming, or if on another filesystem by copying to a temporary file next to the target,
+    which is synced, optionally verified and renamed to the target. The source of a copy is kept,
+    it is removed after the database was updated, see :meth:`Database.relocate`.
+
+    Returns
+    -------
+    tuple
+        the method ('rename' or 'copy') or None and the error message or None
+    """
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(scene, target)
+        return 'rename', None
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            return None, str(e)
+    part = target + '.part'
+    try:
+        shutil.copy2(scene, part)
+        with open(part, 'rb') as f:
+            os.fsync(f.fileno())
+        if os.path.getsize(part) != os.path.getsize(scene) or (verify and _full_hash(part) != _full_hash(scene)):
+            raise OSError('the copy differs from the source')
+        os.rename(part, target)
+    except OSError as e:
+        if os.path.isfile(part):
+            os.remove(part)
+        return None, str(e)
+    return 'copy', None
+
+
+def _partial_hash(scene, blocksize=65536):
+    """
+    hash the size, the first and the last block of a file, see :meth:`Database.update_hashes`
+
+    Parameters
+    ----------
+    scene: str
+        the file
+    blocksize: int
+        size of the first and last block in bytes
+
+    Returns
+    -------
+    dict or None
+        the entry of table filehashes, None if the file could not be read
+    """
+    try:
+        with open(scene, 'rb') as f:
+            st = os.fstat(f.fileno())
+            digest = hashlib.blake2b(str(st.st_size).encode(), digest_size=20)
+            digest.update(f.read(blocksize))
+            if st.st_size > blocksize:
+                f.seek(max(blocksize, st.st_size - blocksize))
+                digest.update(f.read(blocksize))
+    except OSError:
+        return None
+    return {'scene': scene, 'file_size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino,
+            'partial_hash': digest.hexdigest(), 'full_hash': None}
+
+
+def _full_hash(scene, blocksize=8 * 1024 * 1024):
+    """
+    hash the content of a file, None if it could not be read
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    try:
+        with open(scene, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))
+
+
+def _to_timestamp(value):
+    """
+    ISO 8601 time stamps as in the Sentinel-2 metadata, e.g. 2022-01-17T09:52:39.024Z, are parsed
+    with datetime.fromisoformat, other formats with dateutil
+    """
+    try:
+        if value.endswith('Z'):
+            return datetime.fromisoformat(value[:-1]).replace(tzinfo=timezone.utc)
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+def _to_geometry(value):
+    return WKTElement(value, srid=4326)
+
+
+def _compile_converters(table_schema):
+    """
+    converters of the metadata values (str) to the types of the table columns,
+    computed columns and columns of other types are left out
+
+    Parameters
+    ----------
+    table_schema: sqlalchemy.Table
+
+    Returns
+    -------
+    dict
+        column name: function
+    """
+    converters = {}
+    for column in table_schema.c:
+        if column.computed is not None:
+            continue
+        if isinstance(column.type, Geometry):
+            converters[column.name] = _to_geometry
+        elif isinstance(column.type, DateTime):
+            converters[column.name] = _to_timestamp
+        elif isinstance(column.type, Integer):
+            converters[column.name] = _to_int
+        elif isinstance(column.type, Float):
+            converters[column.name] = float
+        elif isinstance(column.type, String):
+            converters[column.name] = str
+    return converters
+
+
+def _convert_metadata(entries, converters, keys=None):
+    """
+    convert metadata dicts with the converters of :func:`_compile_converters`, keys are made lower case with
+    '_' instead of ' ', keys without a column and values that can not be converted are dropped
+
+    Parameters
+    ----------
+    entries: iterable of [str, dict]
+        scene and metadata
+    converters: dict
+        column name: function
+    keys: dict or None
+        cache of the metadata keys and their column names (None for keys without column), shared between calls
+
+    Returns
+    -------
+    list of [str, dict]
+        scene and converted metadata
+    """
+    if keys is None:
+        keys = {}
+    known = set(key for key, name in keys.items() if name is not None)
+    converted = []
+    for scene, metadata in entries:
+        unseen = metadata.keys() - keys.keys()
+        if unseen:
+            for key in unseen:
+                name = key.lower().replace(' ', '_')
+                keys[key] = name if name in converters else None
+                if keys[key] is not None:
+                    known.add(key)
+        values = {}
+        for key in metadata.keys() & known:
+            name = keys[key]
+            value = metadata[key]
+            if value is None:
+                continue
+            try:
+                values[name] = converters[name](value)
+            except (ValueError, OverflowError):
+                log.debug('{}: could not convert {} {!r}'.format(scene, key, value))
+        converted.append((scene, values))
+    return converted
+
+
+def _batch_converter(columns, output, geometry_columns=()):
+    """
+    function converting fetched rows of the given columns to a NumPy structured array ('numpy')
+    or a pyarrow.RecordBatch ('arrow'), see :meth:`Database.query_db_iter`.
+    Geometries (EWKB as hex string or WKBElement) are converted to WKB.
+    """
+    geometries = [isinstance(x.type, Geometry) or x.name in geometry_columns for x in columns]
+
+    def values(rows, i):
+        if geometries[i]:
+            return [None if row[i] is None else _ewkb_to_wkb(getattr(row[i], 'data', row[i])) for row in rows]
+        return [row[i] for row in rows]
+
+    if output == 'arrow':
+        import pyarrow as pa
+        from .snapshot import arrow_type
+        schema = pa.schema([(x.name, pa.binary() if geometry else arrow_type(x.type))
+                            for x, geometry in zip(columns, geometries)])
+        return lambda rows: pa.record_batch([values(rows, i) for i in range(len(columns))], schema=schema)
+
+    import numpy as np
+    dtypes = []
+    for column in columns:
+        if isinstance(column.type, Integer):
+            dtypes.append('f8' if getattr(column, 'nullable', True) else 'i8')
+        elif isinstance(column.type, Float):
+            dtypes.append('f8')
+        elif isinstance(column.type, DateTime):
+            dtypes.append('datetime64[us]')
+        else:
+            dtypes.append('O')
+    dtype = np.dtype([(x.name, y) for x, y in zip(columns, dtypes)])
+
+    def convert(rows):
+        out = np.empty(len(rows), dtype=dtype)
+        for i, column in enumerate(columns):
+            data = values(rows, i)
+            if dtypes[i] == 'f8':
+                data = [np.nan if x is None else x for x in data]
+            out[column.name] = np.array(data, dtype=dtypes[i])
+        return out
+    return convert
+
+
+def _ewkb_to_wkb(data):
+    """
+    remove the SRID of PostGIS EWKB (bytes, memoryview or hex string), the WKB of the geometry is returned
+    """
+    data = bytes.fromhex(data) if isinstance(data, str) else bytes(data)
+    byteorder = '<' if data[0] == 1 else '>'
+    geometry_type = struct.unpack(byteorder + 'I', data[1:5])[0]
+    if not geometry_type & 0x20000000:
+        return data
+    return data[:1] + struct.pack(byteorder + 'I', geometry_type & ~0x20000000) + data[9:]
+
+
+def _filename_fields(table, scene, columns):
+    """
+    read the fields of :data:`~isos.database_tables.filename_columns` from the file name of a scene
+
+    Parameters
+    ----------
+    table: str
+        the metadata table
+    scene: str
+        the scene
+    columns: iterable of str
+        the column names of the table, fields of other columns are skipped
+
+    Returns
+    -------
+    dict
+        column -> value, None if the file name does not contain the field
+    """
+    fields = {}
+    declared = Base.metadata.tables[table].c
+    for column, pattern in filename_columns.get(table, {}).items():
+        if column not in columns:
+            continue
+        match = re.search(pattern, os.path.basename(scene))
+        value = match.group(1) if match else None
+        if value is not None and isinstance(declared[column].type, Integer):
+            value = int(value)
+        fields[column] = value
+    return fields
+
+
+def _missing_files(files, workers=8):
+    """
+    find the files that do not exist (anymore). The files are grouped by directory and every directory is listed
+    only once with :func:`os.scandir`, the directories in parallel threads.
+    Files in directories that cannot be listed are checked one by one.
+
+    Parameters
+    ----------
+    files: list of str
+        the file names
+    workers: int
+        number of threads listing directories
+
+    Returns
+    -------
+    list of str
+        the missing files
+    """
+    by_directory = {}
+    for name in files:
+        by_directory.setdefault(os.path.dirname(name), []).append(name)
+
+    def check(directory):
+        try:
+            with os.scandir(directory or '.') as it:
+                existing = set(entry.name for entry in it if entry.is_file())
+        except (FileNotFoundError, NotADirectoryError):
+            return by_directory[directory]
+        except OSError:
+            return [x for x in by_directory[directory] if not os.path.isfile(x)]
+        return [x for x in by_directory[directory] if os.path.basename(x) not in existing]
+
+    missing = []
+    for result in _imap_bounded(check, list(by_directory.keys()), workers, buffersize=workers * 4):
+        missing.extend(result)
+    return missing
+
+
+def _ichunks(iterable, size):
+    """
+    split any iterable into consecutive lists of at most `size` items, without materializing it
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _prefetch(iterable, maxsize=2):
+    """
+    consume an iterable in a background thread, handing its items over through a queue of at most `maxsize` items.
+    Exceptions are raised in the consuming thread, the background thread stops if the consumer stops early.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except Exception as e:
+            put((end, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _chunks(sequence, size=10000):
+    """
+    split a list into consecutive chunks of at most `size` items
+    """
+    for i in range(0, len(sequence), size):
+        yield sequence[i:i + size]
+
+
 def tables_to_create(s1=True, s2=True):
     """
     Dynamically retrieve all table classes from database_tables
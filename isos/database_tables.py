@@ -6,14 +6,35 @@ Setup for a Database
 This file contains the structure of the database.
 Each table is structured within a Class with declarative Base.
 
+Secondary indexes are declared with the columns (B-tree, `index=True`) or in `__table_args__`,
+geometry columns get a GiST index (geoalchemy2's default). They are created with the tables,
+Database.ensure_indexes adds missing ones to existing databases.
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Float, Boolean, UniqueConstraint, Index, func, \
+    Computed
 from sqlalchemy.ext.declarative import declarative_base
 from geoalchemy2 import Geometry
 
 Base = declarative_base()
 
+# start and stop time columns of the metadata tables, used for date range selections in Database.query_db
+date_columns = {'sentinel1data': ('start_time', 'stop_time'),
+                'sentinel2data': ('product_start_time', 'product_stop_time')}
+
+# typed copies of string time columns in format YYYYmmddTHHMMSS: column -> source column
+timestamp_columns = {'sentinel1data': {'start_time': 'start', 'stop_time': 'stop'}}
+
+# fields encoded in the scene file names: column -> regular expression with one group, read in Python
+# during ingestion and by PostgreSQL in Database.backfill, so the syntax must be valid for both
+filename_columns = {'sentinel1data': {'datatake_id': r'_([0-9A-F]{6})_[0-9A-F]{4}(?:\.zip|\.SAFE)?$',
+                                      'product_unique_id': r'_([0-9A-F]{4})(?:\.zip|\.SAFE)?$'},
+                    'sentinel2data': {'mgrs_tile': r'_T([0-9]{2}[A-Z]{3})_',
+                                      'relative_orbit': r'_R([0-9]{3})_'}}
+
+# bookkeeping tables, which do not hold scene metadata and are skipped by default in Database.get_tablenames
+internal_tables = ['scandirectories', 'scanfiles', 'ingestqueue', 'filehashes', 'schemainfo', 'movejournal']
+
 
 # class Sentinel2Meta(Base):
 #     """
@@ -91,8 +112,9 @@ class Sentinel2Data(Base):
     """
     __tablename__ = 'sentinel2data'
 
-    outname_base = Column(String)
+    outname_base = Column(String, index=True)
     scene = Column(String, primary_key=True)
+    filename = Column(String, Computed("regexp_replace(scene, '^.*/', '')"), index=True)  # basename of scene
     aot_quantification_value = Column(Float)  # 1000.0
     aot_quantification_value_unit = Column(String)  # none
     aot_retrieval_accuracy = Column(Float)  # 0.0
@@ -123,10 +145,13 @@ class Sentinel2Data(Base):
     preview_image_url = Column(String)  # Not applicable
     processing_baseline = Column(Float)  # 02.13
     processing_level = Column(String)  # Level - 2A
-    product_start_time = Column(DateTime)  # 2020 - 02 - 02T10: 41:49.024Z
+    product_start_time = Column(DateTime, index=True)  # 2020 - 02 - 02T10: 41:49.024Z
     product_stop_time = Column(DateTime)  # 2020 - 02 - 02T10: 41:49.024Z
-    product_type = Column(String)  # S2MSI2A
+    product_type = Column(String, index=True)  # S2MSI2A
     product_uri = Column(String)  # S2B_MSIL2A_20200202T104149_N0213_R008_T32UMB_20200202T123131.SAFE
+    mgrs_tile = Column(String, index=True)  # 32UMB, from the file name
+    relative_orbit = Column(Integer)  # 8, from the file name
+    metadata_level = Column(String, index=True)  # 'light': from the file name only, 'full': from the metadata
     radiative_transfer_accuracy = Column(Float)  # 0.0
     radiometric_quality = Column(String)  # PASSED
     reflectance_conversion_u = Column(Float)  # 1.03090709722802
@@ -153,17 +178,23 @@ class Sentinel1Data(Base):
     sensor = Column(String)
     orbit = Column(String)
     orbitNumber_abs = Column(Integer)
-    orbitNumber_rel = Column(Integer)
+    orbitNumber_rel = Column(Integer, index=True)
     cycleNumber = Column(Integer)
     frameNumber = Column(Integer)
     acquisition_mode = Column(String)
     start = Column(String)
     stop = Column(String)
+    start_time = Column(DateTime, index=True)
+    stop_time = Column(DateTime)
+    datatake_id = Column(String)  # mission data take ID, from the file name
+    product_unique_id = Column(String)  # from the file name
+    metadata_level = Column(String, index=True)  # 'light': from the file name only, 'full': from the metadata
     product = Column(String)
     samples = Column(Integer)
     lines = Column(Integer)
-    outname_base = Column(String)
+    outname_base = Column(String, index=True)
     scene = Column(String, primary_key=True)
+    filename = Column(String, Computed("regexp_replace(scene, '^.*/', '')"), index=True)  # basename of scene
     hh = Column(Integer)
     vv = Column(Integer)
     hv = Column(Integer)
@@ -189,7 +220,7 @@ class ExistingS1(Base):
     __tablename__ = 'existings1'
 
     scene = Column(String, primary_key=True)
-    outname_base = Column(String)
+    outname_base = Column(String, index=True)
     read_permission = Column(Integer)
     file_size_MB = Column(Integer)
     owner = Column(String)
@@ -202,7 +233,91 @@ class ExistingS2(Base):
     __tablename__ = 'existings2'
 
     scene = Column(String, primary_key=True)
-    outname_base = Column(String)
+    outname_base = Column(String, index=True)
     read_permission = Column(Integer)
     file_size_MB = Column(Integer)
     owner = Column(String)
+
+
+class ScanDirectory(Base):
+    """
+    snapshot of all searched directories and their modification time, used by the incremental file search
+    """
+    __tablename__ = 'scandirectories'
+    # supports the prefix (LIKE 'dir/%') selections of a search directory
+    __table_args__ = (Index('ix_scandirectories_directory_pattern', 'directory',
+                            postgresql_ops={'directory': 'varchar_pattern_ops'}),)
+
+    directory = Column(String, primary_key=True)
+    mtime_ns = Column(BigInteger)
+
+
+class ScanFile(Base):
+    """
+    snapshot of all found scenes with size, modification time and inode, used by the incremental file search
+    """
+    __tablename__ = 'scanfiles'
+    __table_args__ = (Index('ix_scanfiles_directory_pattern', 'directory',
+                            postgresql_ops={'directory': 'varchar_pattern_ops'}),)
+
+    scene = Column(String, primary_key=True)
+    directory = Column(String)
+    file_size = Column(BigInteger)
+    mtime_ns = Column(BigInteger)
+    inode = Column(BigInteger)
+
+
+class IngestQueue(Base):
+    """
+    work queue of scenes to be ingested into table `target`, shared by all ingest workers.
+    state is one of pending, parsing, ingested or failed.
+    """
+    __tablename__ = 'ingestqueue'
+    __table_args__ = (Index('ix_ingestqueue_target_state', 'target', 'state'),)
+
+    scene = Column(String, primary_key=True)
+    target = Column(String)
+    state = Column(String)
+    attempts = Column(Integer)
+    last_error = Column(String)
+    worker = Column(String)
+    created = Column(DateTime, server_default=func.now())
+    updated = Column(DateTime, server_default=func.now())
+
+
+class FileHash(Base):
+    """
+    duplicate index: hash of size, first and last block of each scene, and of the full content for scenes sharing
+    their partial hash with others. Size, modification time and inode tell whether a scene changed since hashing.
+    """
+    __tablename__ = 'filehashes'
+
+    scene = Column(String, primary_key=True)
+    file_size = Column(BigInteger)
+    mtime_ns = Column(BigInteger)
+    inode = Column(BigInteger)
+    partial_hash = Column(String, index=True)
+    full_hash = Column(String, index=True)
+
+
+class SchemaInfo(Base):
+    """
+    key-value information about the database, e.g. the version of the schema created by Database
+    """
+    __tablename__ = 'schemainfo'
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+
+class MoveJournal(Base):
+    """
+    journal of Database.relocate: old (scene) and new path (target) of each scene to move.
+    state is planned, transferred or committed, method is rename or copy.
+    """
+    __tablename__ = 'movejournal'
+
+    scene = Column(String, primary_key=True)
+    target = Column(String)
+    state = Column(String)
+    method = Column(String)
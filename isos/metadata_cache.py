@@ -0,0 +1,149 @@
+"""
+On-disk cache of the metadata read from the scene files, so that a re-ingest (update runs, schema changes,
+a database rebuilt after :func:`~isos.database.drop_archive`) does not open every zip again.
+
+The scene files do not change once downloaded, an entry is valid as long as path, size and modification time
+of the file are unchanged. The entries are kept in a local SQLite file, the least recently used ones are dropped
+when the number of entries exceeds a limit.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class MetadataCache(object):
+    """
+    Cache of the metadata of scene files, see the module description
+
+    Parameters
+    ----------
+    path: str
+        the SQLite file, created if missing
+    max_entries: int
+        maximum number of cached scenes, the least recently used are dropped first
+
+    Examples
+    --------
+    >>> with MetadataCache('/data/isos_metadata.sqlite') as cache:
+    ...     with Database('isos_db', metadata_cache=cache) as db:
+    ...         db.ingest_s2_from_id(scenes)
+    """
+
+    def __init__(self, path, max_entries=2000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS metadata (scene TEXT PRIMARY KEY, kind TEXT, '
+                              'file_size INTEGER, mtime_ns INTEGER, used REAL, metadata TEXT)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS metadata_used ON metadata (used)')
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, scenes):
+        """
+        look up the metadata of scenes
+
+        Parameters
+        ----------
+        kind: str
+            the kind of metadata, e.g. the table name, entries of other kinds are not returned
+        scenes: list of str
+            the scene paths
+
+        Returns
+        -------
+        dict
+            scene: metadata of the scenes with a valid entry
+        """
+        # isos.database imports this module
+        from .database import _chunks
+        fingerprints = _fingerprints(scenes)
+        found = {}
+        now = time.time()
+        with self.lock:
+            for chunk in _chunks(list(fingerprints), 500):
+                rows = self.conn.execute('SELECT scene, kind, file_size, mtime_ns, metadata FROM metadata '
+                                         'WHERE scene IN ({})'.format(','.join('?' * len(chunk))), chunk)
+                for scene, entry_kind, file_size, mtime_ns, metadata in rows:
+                    if entry_kind == kind and fingerprints[scene] == (file_size, mtime_ns):
+                        found[scene] = json.loads(metadata)
+            with self.conn:
+                self.conn.executemany('UPDATE metadata SET used = ? WHERE scene = ?',
+                                      [(now, scene) for scene in found])
+        self.hits += len(found)
+        self.misses += len(scenes) - len(found)
+        return found
+
+    def put(self, kind, entries):
+        """
+        store the metadata of scenes, replacing existing entries
+
+        Parameters
+        ----------
+        kind: str
+            the kind of metadata, see :meth:`get`
+        entries: list of tuple
+            (scene, metadata), the metadata must be serializable to JSON
+
+        Returns
+        -------
+        """
+        entries = list(entries)
+        fingerprints = _fingerprints([scene for scene, metadata in entries])
+        now = time.time()
+        rows = [(scene, kind) + fingerprints[scene] + (now, json.dumps(metadata))
+                for scene, metadata in entries if scene in fingerprints]
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.__evict()
+
+    def __evict(self):
+        count = self.conn.execute('SELECT count(*) FROM metadata').fetchone()[0]
+        if count > self.max_entries:
+            # evict down to 90 % of the limit to not run on every insert once the cache is full
+            excess = count - int(self.max_entries * 0.9)
+            self.conn.execute('DELETE FROM metadata WHERE scene IN '
+                              '(SELECT scene FROM metadata ORDER BY used LIMIT ?)', (excess,))
+            log.debug('evicted {} metadata cache entries'.format(excess))
+
+    def clear(self):
+        """
+        remove all entries
+        """
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM metadata')
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT count(*) FROM metadata').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _fingerprints(scenes):
+    """
+    (size, modification time in ns) of the scene files that exist
+    """
+    out = {}
+    for scene in scenes:
+        try:
+            st = os.stat(scene)
+        except OSError:
+            continue
+        out[scene] = (st.st_size, st.st_mtime_ns)
+    return out
@@ -1,9 +1,203 @@
 import os
-from spatialist.ancillary import finder
-from .database import Database
+import re
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from sqlalchemy import or_
+from .database import Database, _ichunks, _prefetch
 
+log = logging.getLogger(__name__)
 
-def filewalker(directory, dbname='isos_db', user='user', password='password', port=8888, update=True):
+pattern_s1 = '^S1[AB]_(S1|S2|S3|S4|S5|S6|IW|EW|WV|EN|N1|N2|N3|N4|N5|N6|IM)_(SLC|GRD|OCN)(F|H|M|_)_' \
+             '(1|2)(S|A)(SH|SV|DH|DV|VV|HH|HV|VH)_([0-9]{8}T[0-9]{6})_([0-9]{8}T[0-9]{6})_([0-9]{6})_' \
+             '([0-9A-F]{6})_([0-9A-F]{4}).zip$'
+pattern_s2 = '^S2[AB]_(MSIL1C|MSIL2A)_([0-9]{8}T[0-9]{6})_N([0-9]{4})_R([0-9]{3})_' \
+             'T([0-9A-Z]{5})_([0-9]{8}T[0-9]{6}).zip$'
+scene_patterns = {'s1': pattern_s1, 's2': pattern_s2}
+
+
+def _compile_patterns(patterns):
+    """
+    combine the scene patterns into one regular expression with a named group per key,
+    and collect their literal prefixes for a cheap check before matching
+    """
+    regex = re.compile('|'.join('(?P<{}>{})'.format(key, value) for key, value in patterns.items()))
+    prefixes = []
+    for value in patterns.values():
+        literal = re.match(r'\^(\w*)', value)
+        prefixes.append(literal.group(1) if literal else '')
+    return regex, tuple(prefixes) if all(prefixes) else ('',)
+
+
+def _read_folder(folder, regex, prefixes):
+    """
+    list a folder once, returns its subfolders and the matching scenes with key of the matching pattern and
+    the stat result of the directory entry
+    """
+    subfolders = []
+    scenes = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+            elif entry.name.startswith(prefixes):
+                match = regex.search(entry.name)
+                if match and entry.is_file():
+                    scenes[entry.path] = (match.lastgroup, entry.stat())
+    return subfolders, scenes
+
+
+def _walk_parallel(directory, visit, workers):
+    """
+    walk a directory tree, visiting the folders in a thread pool as soon as they are found.
+    `visit` gets a folder and returns the subfolders to descend into and a result, which is yielded with the folder.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(visit, directory): directory}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder = pending.pop(future)
+                subfolders, result = future.result()
+                for subfolder in subfolders:
+                    pending[executor.submit(visit, subfolder)] = subfolder
+                yield folder, result
+
+
+def scan_directory(directory, patterns=None, workers=8):
+    """
+    search a directory recursively for scenes in a single pass. Subfolders are listed in parallel threads,
+    all patterns are matched at once and the stat result of each found scene is kept.
+
+    Parameters
+    ----------
+    directory: str
+        path to data to be searched
+    patterns: dict or None
+        key -> regular expression for scene basenames, default :data:`scene_patterns`
+    workers: int
+        number of threads listing folders
+
+    Returns
+    -------
+    dict
+        scene -> (key of the matching pattern, :class:`os.stat_result`)
+    """
+    return dict(_iter_scan(directory, patterns, workers))
+
+
+def _iter_scan(directory, patterns=None, workers=8):
+    """
+    generator version of :func:`scan_directory`, yields (scene, (key, stat result)) folder by folder
+    """
+    regex, prefixes = _compile_patterns(scene_patterns if patterns is None else patterns)
+
+    def visit(folder):
+        try:
+            return _read_folder(folder, regex, prefixes)
+        except OSError:
+            return [], {}
+
+    for folder, scenes in _walk_parallel(directory, visit, workers):
+        yield from scenes.items()
+
+
+def scan_incremental(directory, dir_snapshot, file_snapshot, patterns=None, workers=8):
+    """
+    search a directory recursively for scenes, only listing the folders whose modification time differs from the
+    snapshot of the last search. Folders with unchanged modification time are not read again, their subfolders are
+    taken from the snapshot, their scenes are assumed unchanged.
+
+    Parameters
+    ----------
+    directory: str
+        path to data to be searched
+    dir_snapshot: dict
+        directory -> modification time in ns, as returned by :meth:`Database.get_scan_snapshot`
+    file_snapshot: dict
+        scene -> (size, modification time in ns, inode), as returned by :meth:`Database.get_scan_snapshot`
+    patterns: dict or None
+        key -> regular expression for scene basenames, default :data:`scene_patterns`
+    workers: int
+        number of threads listing folders
+
+    Returns
+    -------
+    dict
+        'directories': new or changed directories with their modification time,
+        'removed_directories': directories no longer existing,
+        'files': new or changed scenes with (key of the matching pattern, :class:`os.stat_result`),
+        'added', 'changed', 'removed': lists of scenes
+    """
+    directory = os.path.normpath(directory)
+    if not os.path.isdir(directory):
+        raise RuntimeError('directory {} not found'.format(directory))
+    regex, prefixes = _compile_patterns(scene_patterns if patterns is None else patterns)
+
+    subdirs_snapshot = defaultdict(list)
+    for folder in dir_snapshot.keys():
+        if folder != directory:
+            subdirs_snapshot[os.path.dirname(folder)].append(folder)
+    files_snapshot = defaultdict(list)
+    for scene in file_snapshot.keys():
+        files_snapshot[os.path.dirname(scene)].append(scene)
+
+    def visit(folder):
+        # returns the subfolders and None for unchanged, False for missing or (mtime, scenes) for changed folders
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+            if dir_snapshot.get(folder) == mtime:
+                return subdirs_snapshot[folder], None
+            subfolders, scenes = _read_folder(folder, regex, prefixes)
+        except (FileNotFoundError, NotADirectoryError):
+            return [], False
+        except OSError:
+            # unreadable at the moment, keep the state of the last search
+            return subdirs_snapshot[folder], None
+        return subfolders, (mtime, scenes)
+
+    out = {'directories': {}, 'removed_directories': [], 'files': {}, 'added': [], 'changed': [], 'removed': []}
+    visited = set()
+    for folder, state in _walk_parallel(directory, visit, workers):
+        if state is False:
+            continue
+        visited.add(folder)
+        if state is None:
+            continue
+        mtime, scenes = state
+        out['directories'][folder] = mtime
+        for scene, (key, st) in scenes.items():
+            old = file_snapshot.get(scene)
+            if old is None:
+                out['added'].append(scene)
+            elif tuple(old) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                out['changed'].append(scene)
+            else:
+                continue
+            out['files'][scene] = (key, st)
+        out['removed'].extend(x for x in files_snapshot[folder] if x not in scenes)
+
+    for folder in dir_snapshot.keys():
+        if folder not in visited:
+            out['removed_directories'].append(folder)
+            out['removed'].extend(files_snapshot[folder])
+    return out
+
+
+def _existing_entry(scene, file_size, owner):
+    """
+    create an entry for the tables existings1/existings2
+    """
+    return {'scene': scene,
+            'outname_base': os.path.basename(scene),
+            'read_permission': int(os.access(scene, os.R_OK)),
+            'file_size_MB': int(file_size / (1024 * 1024)),
+            'owner': owner}
+
+
+def filewalker(directory, dbname='isos_db', user='user', password='password', port=8888, update=True,
+               incremental=False, workers=8, chunksize=1000, light=False, hashes=False, shared=False, cleanup=True,
+               fast=False):
     """
     gets dir, searches for s1 and s2, stores into tables ExistS1/2 with note of readability
 
@@ -18,43 +212,85 @@ def filewalker(directory, dbname='isos_db', user='user', password='password', po
     port: int
     update: bool
         update the exists table, default true to be up to date
+    incremental: bool
+        only search directories changed since the last incremental search (see :func:`scan_incremental`)
+        and only write new, changed and removed scenes to the exists tables
+    workers: int
+        number of threads listing folders, see :func:`scan_directory`
+    chunksize: int
+        number of scenes written to the exists tables at once
+    light: bool
+        also register the found scenes in the metadata tables from their file names,
+        so that they can be searched before their full ingest, see :meth:`Database.ingest_light`
+    hashes: bool
+        update the duplicate index of the found scenes, see :meth:`Database.update_hashes`
+    shared: bool
+        open the database on the shared, pooled engine, see :class:`Database`
+    cleanup: bool
+        remove missing scenes from the tables first, see :meth:`Database.cleanup`
+    fast: bool
+        open the database in fast mode, without host and schema checks if the schema is current,
+        see :class:`Database`
 
     Returns
     -------
+    dict or None
+        if `incremental`, the lists of 'added', 'changed' and 'removed' scenes
     """
-    pattern_s1 = '^S1[AB]_(S1|S2|S3|S4|S5|S6|IW|EW|WV|EN|N1|N2|N3|N4|N5|N6|IM)_(SLC|GRD|OCN)(F|H|M|_)_' \
-                 '(1|2)(S|A)(SH|SV|DH|DV|VV|HH|HV|VH)_([0-9]{8}T[0-9]{6})_([0-9]{8}T[0-9]{6})_([0-9]{6})_' \
-                 '([0-9A-F]{6})_([0-9A-F]{4}).zip$'
-    pattern_s2 = '^S2[AB]_(MSIL1C|MSIL2A)_([0-9]{8}T[0-9]{6})_N([0-9]{4})_R([0-9]{3})_' \
-                 'T([0-9A-Z]{5})_([0-9]{8}T[0-9]{6}).zip$'
-    scenes_s1 = finder(directory, [pattern_s1], recursive=True, regex=True)
-    scenes_s2 = finder(directory, [pattern_s2], recursive=True, regex=True)
-
-    with Database(dbname, user=user, password=password, port=port) as db:
-        orderly_exist_s1 = []
-        for scene in scenes_s1:
-            orderly_exist_s1.append({'scene': scene,
-                                     'outname_base': os.path.basename(scene),
-                                     'read_permission': int(os.access(scene, os.R_OK)),
-                                     'file_size_MB': int(os.stat(scene).st_size / (1024 * 1024)),
-                                     'owner': os.stat(scene).st_uid
-                                     })
-        orderly_exist_s2 = []
-        for scene in scenes_s2:
-            orderly_exist_s2.append({'scene': scene,
-                                     'outname_base': os.path.basename(scene),
-                                     'read_permission': int(os.access(scene, os.R_OK)),
-                                     'file_size_MB': int(os.stat(scene).st_size / (1024 * 1024)),
-                                     'owner': os.stat(scene).st_uid})
-
-        db.insert(table='existings1', primary_key=db.get_primary_keys('existings1'),
-                  orderly_data=orderly_exist_s1, update=update)
-        db.insert(table='existings2', primary_key=db.get_primary_keys('existings2'),
-                  orderly_data=orderly_exist_s2, update=update)
+    with Database(dbname, user=user, password=password, port=port, shared=shared, cleanup=cleanup,
+                  fast=fast) as db:
+        delta = None
+        if incremental:
+            delta = scan_incremental(directory, *db.get_scan_snapshot(directory), workers=workers)
+            found = delta['files'].items()
+        else:
+            found = _iter_scan(directory, workers=workers)
+
+        # the scenes are written to the exists tables chunk by chunk while the search goes on
+        primary_keys = {table: db.get_primary_keys(table) for table in ['existings1', 'existings2']}
+        for chunk in _prefetch(_ichunks(found, chunksize)):
+            for table, sensor in [('existings1', 's1'), ('existings2', 's2')]:
+                orderly_exist = [_existing_entry(scene, st.st_size, st.st_uid)
+                                 for scene, (key, st) in chunk if key == sensor]
+                if len(orderly_exist) > 0:
+                    db.insert(table=table, primary_key=primary_keys[table],
+                              orderly_data=orderly_exist, update=update, bulk=True, chunksize=chunksize)
+            if light:
+                db.ingest_light([scene for scene, (key, st) in chunk], chunksize=chunksize)
+
+        if incremental:
+            for table in ['existings1', 'existings2', 'sentinel1data', 'sentinel2data', 'ingestqueue', 'filehashes']:
+                db.drop_elements(delta['removed'], table)
+            db.update_scan_snapshot(directories=delta['directories'],
+                                    files={scene: (st.st_size, st.st_mtime_ns, st.st_ino)
+                                           for scene, (key, st) in delta['files'].items()},
+                                    removed_directories=delta['removed_directories'],
+                                    removed_files=delta['removed'])
+            delta = {key: delta[key] for key in ['added', 'changed', 'removed']}
+        if hashes:
+            db.update_hashes(workers=workers, chunksize=chunksize)
         db.close()
+    return delta
 
 
-def ingest_from_exist_table(dbname='isos_db', user='user', password='password', port=8888, update=True):
+def _readable_scenes(db, session, table, data_table=None):
+    """
+    select the readable scenes of an exists table. If `data_table` is given, only scenes without an entry in it
+    are selected with an anti-join (existings LEFT JOIN data WHERE data.scene IS NULL), and the scenes only
+    registered from their file names (see :meth:`Database.ingest_light`)
+    """
+    exist_schema = db.load_table(table)
+    query = session.query(exist_schema.c.scene).filter(exist_schema.c.read_permission == 1)
+    if data_table is not None:
+        data_schema = db.load_table(data_table)
+        query = query.outerjoin(data_schema, data_schema.c.scene == exist_schema.c.scene).filter(
+            or_(data_schema.c.scene.is_(None), data_schema.c.metadata_level == 'light'))
+    return [x[0] for x in query]
+
+
+def ingest_from_exist_table(dbname='isos_db', user='user', password='password', port=8888, update=True,
+                            delta=False, changed=None, workers=1, chunksize=1000, queue=False, cleanup=True,
+                            shared=False, metadata_cache=None):
     """
     gets data from exists tables with read permission and ingests the metadata into the according tables
 
@@ -67,30 +303,60 @@ def ingest_from_exist_table(dbname='isos_db', user='user', password='password',
     port: int
     update: bool
         update the exists table, default true to be up to date
+    delta: bool
+        only ingest scenes that are not yet registered in the metadata tables or only from their file names,
+        and those listed in `changed`. Already ingested scenes are not opened again.
+    changed: list of str or None
+        scenes modified since their ingestion, re-ingested in `delta` mode,
+        e.g. the 'changed' scenes of an incremental :func:`filewalker` run
+    workers: int
+        number of processes reading the Sentinel-1 scenes and threads reading the Sentinel-2 scenes,
+        see :meth:`Database.parse_id` and :meth:`Database.identify_sentinel2_from_folder`
+    chunksize: int
+        number of scenes parsed and committed at once
+    queue: bool
+        ingest through the persistent ingest queue, see :meth:`Database.ingest_from_queue`.
+        Scenes not yet registered are queued, `changed` scenes are queued again. An interrupted run continues
+        where it stopped, and several runs, also on different nodes, can share the work.
+    cleanup: bool
+        remove missing scenes from the tables first, see :meth:`Database.cleanup`.
+        Not needed directly after :func:`filewalker`, which already did so.
+    shared: bool
+        open the database on the shared, pooled engine in fast mode, see :class:`Database`
+    metadata_cache: str or None
+        path of the cache of the metadata read from the scenes, see :class:`~isos.metadata_cache.MetadataCache`
 
     Returns
     -------
     """
-
-    with Database(dbname, user=user, password=password, port=port) as db:
+    with Database(dbname, user=user, password=password, port=port, cleanup=cleanup,
+                  shared=shared, fast=shared, metadata_cache=metadata_cache) as db:
         session = db.Session()
-        scene_dirs = session.query(db.load_table('existings1').c.scene).filter(
-            db.load_table('existings1').c.read_permission == 1).all()
-        ingest = []
-        for i in scene_dirs:
-            ingest.append(i[0])
-        db.ingest_s1_from_id(ingest, update=update)
-        scene_dirs = session.query(db.load_table('existings2').c.scene).filter(
-            db.load_table('existings2').c.read_permission == 1).all()
-        ingest = []
-        for i in scene_dirs:
-            ingest.append(i[0])
-        db.ingest_s2_from_id(ingest, update=update)
+        for table, data_table, ingest_function in [('existings1', 'sentinel1data', db.ingest_s1_from_id),
+                                                   ('existings2', 'sentinel2data', db.ingest_s2_from_id)]:
+            if queue:
+                db.enqueue_scenes(_readable_scenes(db, session, table, data_table), data_table)
+                if changed:
+                    readable = set(_readable_scenes(db, session, table))
+                    db.enqueue_scenes([x for x in changed if x in readable], data_table, requeue=True)
+                db.ingest_from_queue(data_table, update=update, workers=workers, chunksize=chunksize)
+                continue
+            if delta:
+                ingest = _readable_scenes(db, session, table, data_table)
+                if changed:
+                    readable = set(_readable_scenes(db, session, table))
+                    ingest += sorted(x for x in set(changed).difference(ingest) if x in readable)
+                log.info('{} new or changed scenes to ingest from table {}'.format(len(ingest), table))
+            else:
+                ingest = _readable_scenes(db, session, table)
+            ingest_function(ingest, update=update, workers=workers, chunksize=chunksize)
         session.close()
         db.close()
 
 
-def cronjob_task(directory, dbname, user, password, port, update=True):
+def cronjob_task(directory, dbname, user, password, port, update=True, incremental=False, workers=1,
+                 chunksize=1000, queue=False, light=False, hashes=False, metadata_cache=None, cleanup=True,
+                 fast=False, shared=False):
     """
     function to run the periodic table update
 
@@ -105,10 +371,38 @@ def cronjob_task(directory, dbname, user, password, port, update=True):
     port: int
     update: bool
         update the exists table, default true to be up to date
+    incremental: bool
+        only search changed directories and only ingest new and changed scenes,
+        see :func:`filewalker` and :func:`ingest_from_exist_table`
+    workers: int
+        number of workers reading the scenes, see :func:`ingest_from_exist_table`
+    chunksize: int
+        number of scenes processed and committed at once
+    queue: bool
+        ingest through the persistent, resumable ingest queue, see :func:`ingest_from_exist_table`
+    light: bool
+        register the found scenes from their file names before the full ingest, see :func:`filewalker`
+    hashes: bool
+        update the duplicate index, see :meth:`Database.update_hashes` and :meth:`Database.find_duplicates`
+    metadata_cache: str or None
+        path of the cache of the metadata read from the scenes, see :func:`ingest_from_exist_table`
+    cleanup: bool
+        remove missing scenes from the tables first, see :func:`filewalker`
+    fast: bool
+        skip the host and schema checks if the schema is current, e.g. for frequent runs of a long-running
+        process, see :func:`filewalker`
+    shared: bool
+        open the database on the shared, pooled engine, so that both stages and repeated calls use the same
+        connections. The engine stays open after the call, the caller closes it with
+        :func:`~isos.database.dispose_engines`. Default False: each stage opens and closes an engine of its own.
 
     Returns
     -------
     """
-    filewalker(directory, dbname, user, password, port, update)
-    ingest_from_exist_table(dbname, user, password, port, update)
-
+    delta = filewalker(directory, dbname, user, password, port, update, incremental=incremental,
+                       chunksize=chunksize, light=light, hashes=hashes, shared=shared, cleanup=cleanup, fast=fast)
+    # the missing scenes were already removed by the first stage
+    ingest_from_exist_table(dbname, user, password, port, update, delta=incremental,
+                            changed=None if delta is None else delta['changed'],
+                            workers=workers, chunksize=chunksize, queue=queue, cleanup=False, shared=shared,
+                            metadata_cache=metadata_cache)
@@ -0,0 +1,300 @@
+"""
+Query service: an asyncio HTTP server answering the lookups of many clients, e.g. the workers of a processing cluster,
+with a few pooled connections of the async PostgreSQL driver asyncpg, instead of each client opening its own
+Database and reflecting the schema.
+
+The methods query_db, filter_scenelist, is_registered and count_scenes are called by POST requests with the
+arguments as JSON object, the response holds the result as JSON object {"result": ...}:
+
+    $ curl --unix-socket /tmp/isos.sock -d '{"table": "sentinel2data", "mgrs_tile": "32UMB"}' http://isos/query_db
+
+Identical requests running at the same time are answered by one database query, results are cached for a while.
+"""
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.sql import func
+from geoalchemy2 import WKTElement
+from .database import Database, _membership_query
+
+log = logging.getLogger(__name__)
+
+
+class Coalescer(object):
+    """
+    Runs identical requests only once at a time and caches their results
+
+    Parameters
+    ----------
+    ttl: float
+        seconds a result is cached, 0 to only coalesce running requests
+    size: int
+        maximum number of cached results, the least recently used are dropped first
+    """
+
+    def __init__(self, ttl=30, size=10000):
+        self.ttl = ttl
+        self.size = size
+        self.cache = OrderedDict()
+        self.running = {}
+
+    async def run(self, key, factory):
+        """
+        return the result for a key, from the cache, from a running request with the same key
+        or from a new one
+
+        Parameters
+        ----------
+        key: hashable
+            identifies the request
+        factory: function
+            returns the coroutine computing the result
+
+        Returns
+        -------
+        the result
+        """
+        cached = self.cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self.cache.move_to_end(key)
+                return cached[1]
+            del self.cache[key]
+        task = self.running.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.running[key] = task
+            task.add_done_callback(lambda x: self.__done(key, x))
+        # a client disconnecting must not cancel the request shared with others
+        return await asyncio.shield(task)
+
+    def __done(self, key, task):
+        self.running.pop(key, None)
+        if self.ttl > 0 and not task.cancelled() and task.exception() is None:
+            self.cache[key] = (time.monotonic() + self.ttl, task.result())
+            while len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+
+class QueryService(object):
+    """
+    Read only access to the metadata tables from asyncio code, see the module description
+
+    Parameters
+    ----------
+    dbname: str
+        The name for the PostgreSQL database.
+    user: str
+    password: str
+    host: str
+    port: int
+    pool_size: int
+        number of database connections
+    cache_ttl: float
+        seconds a result is cached, see :class:`Coalescer`
+    cache_size: int
+        maximum number of cached results
+    max_body: int
+        maximum size of a request body in bytes, larger requests are answered with 413 Payload Too Large
+    """
+    methods = ['query_db', 'filter_scenelist', 'is_registered', 'count_scenes']
+
+    def __init__(self, dbname, user='user', password='password', host='localhost', port=5432,
+                 pool_size=5, cache_ttl=30, cache_size=10000, max_body=16 * 1024 * 1024):
+        self.max_body = max_body
+        # the schema is reflected once, the statements are built from the cached schema in the event loop
+        self.db = Database(dbname, user=user, password=password, host=host, port=port,
+                           cleanup=False, shared=True, fast=True)
+        self.tables = self.db.get_tablenames()
+        for table in self.tables:
+            self.db.load_table(table)
+        self.engine = create_async_engine(self.db.url.set(drivername='postgresql+asyncpg'),
+                                          pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
+        self.coalescer = Coalescer(ttl=cache_ttl, size=cache_size)
+
+    def __table(self, table):
+        if table not in self.tables:
+            raise ValueError('unknown table {}'.format(table))
+        return self.db.load_table(table)
+
+    async def __fetch(self, query):
+        async with self.engine.connect() as conn:
+            result = await conn.execute(query)
+            return result.fetchall()
+
+    async def call(self, method, args):
+        """
+        call one of :attr:`methods`, coalesced and cached
+
+        Parameters
+        ----------
+        method: str
+            the method name
+        args: dict
+            the keyword arguments
+
+        Returns
+        -------
+        the result of the method
+        """
+        if method not in self.methods:
+            raise KeyError(method)
+        key = (method, json.dumps(args, sort_keys=True))
+        return await self.coalescer.run(key, lambda: getattr(self, method)(**args))
+
+    async def query_db(self, table, selected_columns='*', date=None, wkt=None, **args):
+        """
+        see :meth:`Database.query_db`, the intersecting geometry is given as WKT string in EPSG:4326
+
+        Returns
+        -------
+        list of dict
+        """
+        query = self.db.build_query(self.__table(table).name, selected_columns, None, date, **args)
+        if wkt is not None:
+            geometry_columns = self.db.get_geometry_columns(table)
+            if len(geometry_columns) == 0:
+                raise ValueError('table {} has no geometry column'.format(table))
+            column = self.db.load_table(table).c[geometry_columns[-1]]
+            query = query.where(func.st_intersects(column, WKTElement(wkt, srid=4326)))
+        return [dict(row._mapping) for row in await self.__fetch(query)]
+
+    async def filter_scenelist(self, scenelist, table):
+        """
+        see :meth:`Database.filter_scenelist`, for scene names
+
+        Returns
+        -------
+        list of str
+        """
+        query = _membership_query(self.__table(table))
+        names = [x.rsplit('/', 1)[-1] for x in scenelist]
+        registered = set(x[0] for x in await self.__fetch(query.params(paths=[], names=sorted(set(names)))))
+        return [x for x, name in zip(scenelist, names) if name not in registered]
+
+    async def is_registered(self, scene, table):
+        """
+        see :meth:`Database.is_registered`, for the scene path or file name
+
+        Returns
+        -------
+        bool
+        """
+        query = _membership_query(self.__table(table))
+        if '/' in scene:
+            query = query.params(paths=[scene], names=[])
+        else:
+            query = query.params(paths=[], names=[scene])
+        return len(await self.__fetch(query)) > 0
+
+    async def count_scenes(self, table):
+        """
+        see :meth:`Database.count_scenes`
+
+        Returns
+        -------
+        list of list
+            outname_base and count
+        """
+        table_schema = self.__table(table)
+        query = select(table_schema.c.outname_base, func.count(table_schema.c.outname_base)) \
+            .group_by(table_schema.c.outname_base)
+        return [list(x) for x in await self.__fetch(query)]
+
+    async def handle(self, reader, writer):
+        """
+        serve the HTTP/1.1 requests of one connection
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                verb, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in [b'\r\n', b'\n', b'']:
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > self.max_body:
+                    # the body is not read, the connection can not be used further
+                    status = '413 Payload Too Large'
+                    payload = {'error': 'maximum body size: {} bytes'.format(self.max_body)}
+                else:
+                    body = await reader.readexactly(length)
+                    status, payload = await self.__respond(verb, path, body)
+                data = json.dumps(payload, default=_json_default).encode()
+                writer.write('HTTP/1.1 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+                             .format(status, len(data)).encode() + data)
+                await writer.drain()
+                if length > self.max_body or headers.get('connection', '').lower() == 'close' \
+                        or version == 'HTTP/1.0':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def __respond(self, verb, path, body):
+        if verb != 'POST':
+            return '405 Method Not Allowed', {'error': 'use POST'}
+        method = path.strip('/')
+        if method not in self.methods:
+            return '404 Not Found', {'error': 'methods: {}'.format(', '.join(self.methods))}
+        try:
+            args = json.loads(body or b'{}')
+            if not isinstance(args, dict):
+                raise ValueError('the arguments must be a JSON object')
+            return '200 OK', {'result': await self.call(method, args)}
+        except (TypeError, ValueError, KeyError) as e:
+            return '400 Bad Request', {'error': str(e)}
+        except Exception as e:
+            log.exception('{} failed'.format(path))
+            return '500 Internal Server Error', {'error': '{}: {}'.format(type(e).__name__, e)}
+
+    async def close(self):
+        await self.engine.dispose()
+        self.db.close()
+
+
+def _json_default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+async def serve(service, host='127.0.0.1', port=8765, path=None):
+    """
+    serve a :class:`QueryService` over TCP or a Unix socket until cancelled
+
+    Parameters
+    ----------
+    service: QueryService
+    host: str
+        address to listen on
+    port: int
+        port to listen on
+    path: str or None
+        path of a Unix socket to listen on instead of `host` and `port`
+
+    Returns
+    -------
+    """
+    if path is not None:
+        server = await asyncio.start_unix_server(service.handle, path=path)
+        log.info('serving on {}'.format(path))
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        log.info('serving on {}:{}'.format(host, port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
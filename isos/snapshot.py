@@ -0,0 +1,237 @@
+"""
+Snapshots of the metadata tables as (Geo)Parquet files, to rebuild a database without scanning the scenes again,
+to clone the catalog to other sites, or to analyse it without PostgreSQL.
+
+Each table is written to a folder of Parquet files of at most `rows_per_file` rows, read from the database with
+a server-side cursor. Geometry columns are stored as WKB with GeoParquet metadata. The import copies the files
+into a temporary table with COPY and inserts the rows from there, so existing entries can be kept or updated.
+
+    >>> with Database('isos_db') as db:
+    ...     export_parquet(db, '/backup/isos')
+    >>> with Database('isos_clone') as db:
+    ...     import_parquet(db, '/backup/isos')
+"""
+import io
+import os
+import glob
+import json
+import struct
+import logging
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select, type_coerce, LargeBinary, Integer, BigInteger, Float, DateTime, Boolean
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql import func, table as table_clause, column
+from geoalchemy2 import Geometry
+
+log = logging.getLogger(__name__)
+
+snapshot_tables = ['sentinel1data', 'sentinel2data', 'existings1', 'existings2']
+
+# GeoParquet names of the PostGIS geometry types
+geoparquet_types = {x.upper(): x for x in ['Point', 'LineString', 'Polygon', 'MultiPoint', 'MultiLineString',
+                                           'MultiPolygon', 'GeometryCollection']}
+
+
+def export_parquet(db, directory, tables=None, fetch_size=10000, rows_per_file=1000000, compression='zstd'):
+    """
+    write tables to (Geo)Parquet files, see the module description
+
+    Parameters
+    ----------
+    db: isos.database.Database
+    directory: str
+        the folder to write to, each table is written to a subfolder. Existing files of the tables are replaced.
+    tables: list of str or None
+        the tables to export, default :data:`snapshot_tables`
+    fetch_size: int
+        number of rows fetched from the server-side cursor and written at once
+    rows_per_file: int
+        maximum number of rows per file
+    compression: str
+        Parquet compression codec
+
+    Returns
+    -------
+    dict
+        table -> number of exported rows
+    """
+    tables = [x for x in (tables or snapshot_tables) if x in db.get_tablenames()]
+    counts = {}
+    for table in tables:
+        table_schema = db.load_table(table)
+        columns = [x for x in table_schema.c if x.computed is None]
+        folder = os.path.join(directory, table)
+        os.makedirs(folder, exist_ok=True)
+        for filename in glob.glob(os.path.join(folder, 'part-*.parquet')):
+            os.remove(filename)
+        schema = pa.schema([(x.name, arrow_type(x.type)) for x in columns], metadata=_geo_metadata(columns))
+        query = select(*[type_coerce(func.ST_AsBinary(x), LargeBinary).label(x.name)
+                         if isinstance(x.type, Geometry) else x for x in columns])
+        writer = None
+        writer_rows = 0
+        count = 0
+        parts = 0
+        with db.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=fetch_size).execute(query)
+            for rows in result.partitions(fetch_size):
+                while len(rows) > 0:
+                    if writer is None or writer_rows == rows_per_file:
+                        if writer is not None:
+                            writer.close()
+                        filename = os.path.join(folder, 'part-{:05d}.parquet'.format(parts))
+                        writer = pq.ParquetWriter(filename, schema, compression=compression)
+                        writer_rows = 0
+                        parts += 1
+                    part = rows[:rows_per_file - writer_rows]
+                    rows = rows[len(part):]
+                    writer.write_batch(pa.record_batch([list(x) for x in zip(*part)], schema=schema))
+                    writer_rows += len(part)
+                    count += len(part)
+        if writer is not None:
+            writer.close()
+        else:
+            # keep the schema of empty tables
+            pq.write_table(schema.empty_table(), os.path.join(folder, 'part-00000.parquet'), compression=compression)
+        counts[table] = count
+        log.info('exported {} rows of table {}'.format(count, table))
+    return counts
+
+
+def import_parquet(db, directory, tables=None, update=False, batch_size=10000):
+    """
+    load tables from the files written by :func:`export_parquet`. Columns missing in the files are left empty,
+    columns missing in the tables are skipped.
+
+    Parameters
+    ----------
+    db: isos.database.Database
+    directory: str
+        the folder written by :func:`export_parquet`
+    tables: list of str or None
+        the tables to import, default all tables found in `directory`
+    update: bool
+        replace existing entries? Default False: existing entries are kept.
+    batch_size: int
+        number of rows read from the files and copied at once
+
+    Returns
+    -------
+    dict
+        table -> number of inserted or updated rows
+    """
+    if tables is None:
+        tables = sorted(os.listdir(directory))
+    counts = {}
+    for table in tables:
+        files = sorted(glob.glob(os.path.join(directory, table, 'part-*.parquet')))
+        if len(files) == 0:
+            continue
+        if table not in db.get_tablenames():
+            log.warning('table {} not in database, skipped'.format(table))
+            continue
+        table_schema = db.load_table(table)
+        available = set(pq.read_schema(files[0]).names)
+        columns = [x for x in table_schema.c if x.computed is None and x.name in available]
+        names = [x.name for x in columns]
+        stage = 'isos_import_{}'.format(table)
+        quoted = ', '.join('"{}"'.format(x) for x in names)
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('CREATE TEMPORARY TABLE "{}" (LIKE "{}") ON COMMIT DROP'.format(stage, table))
+            cursor = conn.connection.cursor()
+            for filename in files:
+                for batch in pq.ParquetFile(filename).iter_batches(batch_size=batch_size, columns=names):
+                    cursor.copy_expert('COPY "{}" ({}) FROM STDIN'.format(stage, quoted),
+                                       _copy_buffer(batch, columns))
+            staged = table_clause(stage, *[column(x) for x in names])
+            insert = pg_insert(table_schema).from_select(names, select(*staged.c))
+            if update:
+                primary_keys = [x.name for x in table_schema.primary_key]
+                insert = insert.on_conflict_do_update(
+                    index_elements=primary_keys,
+                    set_={x: insert.excluded[x] for x in names if x not in primary_keys})
+            else:
+                insert = insert.on_conflict_do_nothing()
+            counts[table] = conn.execute(insert).rowcount
+        log.info('imported {} rows into table {}'.format(counts[table], table))
+    return counts
+
+
+def arrow_type(coltype):
+    """
+    Arrow type of a column type, geometries as WKB. Also used for the 'arrow' output of
+    :meth:`~isos.database.Database.query_db_iter`.
+
+    Parameters
+    ----------
+    coltype: sqlalchemy.types.TypeEngine
+        the column type
+
+    Returns
+    -------
+    pyarrow.DataType
+    """
+    if isinstance(coltype, Geometry):
+        return pa.binary()
+    if isinstance(coltype, BigInteger):
+        return pa.int64()
+    if isinstance(coltype, Integer):
+        return pa.int32()
+    if isinstance(coltype, Float):
+        return pa.float64()
+    if isinstance(coltype, DateTime):
+        return pa.timestamp('us')
+    if isinstance(coltype, Boolean):
+        return pa.bool_()
+    return pa.string()
+
+
+def _geo_metadata(columns):
+    """
+    GeoParquet file metadata of the geometry columns, None if there are none
+    """
+    geometries = [x for x in columns if isinstance(x.type, Geometry)]
+    if len(geometries) == 0:
+        return None
+    metadata = {'version': '1.0.0', 'primary_column': geometries[-1].name, 'columns': {}}
+    for col in geometries:
+        geometry_type = geoparquet_types.get((col.type.geometry_type or '').upper())
+        metadata['columns'][col.name] = {'encoding': 'WKB',
+                                         'geometry_types': [] if geometry_type is None else [geometry_type]}
+    return {b'geo': json.dumps(metadata).encode()}
+
+
+def _ewkb_hex(wkb, srid):
+    """
+    hex encoded EWKB with SRID from WKB, as accepted by the PostGIS geometry input
+    """
+    byteorder = '<' if wkb[0] == 1 else '>'
+    geometry_type = struct.unpack(byteorder + 'I', wkb[1:5])[0]
+    return (wkb[:1] + struct.pack(byteorder + 'II', geometry_type | 0x20000000, srid) + wkb[5:]).hex()
+
+
+def _copy_value(value):
+    """
+    value in the COPY text format
+    """
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_buffer(batch, columns):
+    """
+    the rows of a record batch in the COPY text format
+    """
+    values = []
+    for col in columns:
+        data = batch.column(col.name).to_pylist()
+        if isinstance(col.type, Geometry):
+            srid = col.type.srid if col.type.srid and col.type.srid > 0 else 4326
+            data = [None if x is None else _ewkb_hex(x, srid) for x in data]
+        values.append(data)
+    buffer = io.StringIO()
+    for row in zip(*values):
+        buffer.write('\t'.join(_copy_value(x) for x in row) + '\n')
+    buffer.seek(0)
+    return buffer
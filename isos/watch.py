@@ -0,0 +1,315 @@
+"""
+Watch daemon: ingests new scenes within seconds of their arrival instead of waiting for the next cron run.
+
+The search directories are watched with Linux inotify. Scenes are ingested once no further events arrived
+for them during a settling time, downloads still named ``*.incomplete`` are not matched by the scene patterns
+and are picked up when renamed to their final name. An incremental search runs at start, periodically, and
+after lost events, on filesystems without inotify support (network filesystems only report local changes)
+it is the only mechanism.
+"""
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from .database import database_factory, dispose_engines
+from .search_and_deploy import cronjob_task, scan_directory, scene_patterns, _compile_patterns, _existing_entry
+
+log = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# filesystem types on which inotify misses changes made by other hosts
+remote_filesystems = ['nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'lustre', 'gpfs', 'beegfs', 'ceph', 'glusterfs',
+                      'fuse.sshfs', 'afs']
+
+
+class Inotify(object):
+    """
+    Minimal recursive inotify watch via ctypes
+
+    Raises
+    ------
+    OSError
+        if inotify is not available or the watch limit is reached
+    """
+    mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not supported')
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.watches = {}
+
+    def add_tree(self, directory):
+        """
+        watch a directory and all its subdirectories
+
+        Parameters
+        ----------
+        directory: str
+
+        Returns
+        -------
+        int
+            the number of watched directories
+        """
+        count = 0
+        for folder, subfolders, files in os.walk(directory):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.mask)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in [errno.ENOENT, errno.ENOTDIR, errno.EACCES]:
+                    continue
+                raise OSError(code, os.strerror(code), folder)
+            self.watches[wd] = folder
+            count += 1
+        return count
+
+    def remove_tree(self, directory):
+        """
+        stop watching a directory and all its subdirectories, e.g. after it was moved or deleted.
+        The watches of a moved directory would otherwise report its events under the old path.
+
+        Parameters
+        ----------
+        directory: str
+
+        Returns
+        -------
+        int
+            the number of removed watches
+        """
+        prefix = os.path.join(directory, '')
+        removed = [wd for wd, folder in self.watches.items() if folder == directory or folder.startswith(prefix)]
+        for wd in removed:
+            # fails for watches of deleted directories, which the kernel has already removed
+            self.libc.inotify_rm_watch(self.fd, wd)
+            del self.watches[wd]
+        return len(removed)
+
+    def read(self, timeout):
+        """
+        wait for events
+
+        Parameters
+        ----------
+        timeout: float
+            maximum time to wait in seconds
+
+        Returns
+        -------
+        list of tuple
+            (mask, path) of the events
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 1024 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0'))
+            offset += 16 + length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            folder = self.watches.get(wd)
+            if folder is None and not mask & IN_Q_OVERFLOW:
+                continue
+            events.append((mask, os.path.join(folder, name) if folder and name else folder))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _filesystem_type(path):
+    """
+    type of the filesystem a path is mounted on, from /proc/mounts, None if unknown
+    """
+    path = os.path.realpath(path)
+    found = ('', None)
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                mountpoint = fields[1].replace('\\040', ' ')
+                if (path == mountpoint or path.startswith(mountpoint.rstrip('/') + '/')) \
+                        and len(mountpoint) > len(found[0]):
+                    found = (mountpoint, fields[2])
+    except OSError:
+        return None
+    return found[1]
+
+
+def _start_inotify(directories):
+    """
+    watch the directories with inotify, None if not possible for all of them
+    """
+    for directory in directories:
+        fstype = _filesystem_type(directory)
+        if fstype in remote_filesystems:
+            log.info('{} is on a {} filesystem, falling back to polling'.format(directory, fstype))
+            return None
+    try:
+        inotify = Inotify()
+    except OSError as e:
+        log.info('inotify not available ({}), falling back to polling'.format(e))
+        return None
+    try:
+        count = sum(inotify.add_tree(directory) for directory in directories)
+    except OSError as e:
+        log.info('could not watch all directories ({}), falling back to polling'.format(e))
+        inotify.close()
+        return None
+    log.info('watching {} directories'.format(count))
+    return inotify
+
+
+def _ingest_scenes(open_db, scenes, regex, light=True, workers=1, chunksize=1000):
+    """
+    register scenes in the exists tables and ingest the readable ones into the metadata tables,
+    `regex` are the compiled scene patterns, see :func:`~isos.search_and_deploy._compile_patterns`
+    """
+    found = {'s1': {}, 's2': {}}
+    for scene in scenes:
+        match = regex.search(os.path.basename(scene))
+        if match is None or match.lastgroup not in found:
+            continue
+        try:
+            found[match.lastgroup][scene] = os.stat(scene)
+        except OSError:
+            continue
+    with open_db() as db:
+        for sensor, table, ingest in [('s1', 'existings1', db.ingest_s1_from_id),
+                                      ('s2', 'existings2', db.ingest_s2_from_id)]:
+            if len(found[sensor]) == 0:
+                continue
+            entries = [_existing_entry(scene, st.st_size, st.st_uid) for scene, st in found[sensor].items()]
+            db.insert(table, db.get_primary_keys(table), entries, update=True, bulk=True, chunksize=chunksize)
+            if light:
+                db.ingest_light([x['scene'] for x in entries], chunksize=chunksize)
+            ingest([x['scene'] for x in entries if x['read_permission'] == 1], update=True,
+                   workers=workers, chunksize=chunksize)
+    log.info('ingested {} new scenes'.format(sum(len(x) for x in found.values())))
+
+
+def watch(directories, dbname, user, password, port, interval=3600, settle=10, workers=1, chunksize=1000,
+          light=True, poll=False):
+    """
+    run the watch daemon until interrupted
+
+    Parameters
+    ----------
+    directories: str or list of str
+        the search directories
+    dbname: str
+        name of database
+    user: str
+    password: str
+    port: int
+    interval: int
+        seconds between incremental searches, see :func:`~isos.search_and_deploy.cronjob_task`
+    settle: int
+        seconds without events after which a new scene is ingested
+    workers: int
+        number of workers reading the scenes
+    chunksize: int
+        number of scenes processed and committed at once
+    light: bool
+        register new scenes from their file names before the full ingest,
+        see :meth:`~isos.database.Database.ingest_light`
+    poll: bool
+        only search periodically, e.g. if the directories are changed from other hosts of a network filesystem
+
+    Returns
+    -------
+    """
+    if isinstance(directories, str):
+        directories = [directories]
+    open_db = database_factory(dbname, user=user, password=password, port=port)
+
+    def search(initial=False):
+        # the database is checked and cleaned up at start only, later searches remove missing scenes themselves
+        for directory in directories:
+            try:
+                cronjob_task(directory, dbname, user, password, port, incremental=True, workers=workers,
+                             chunksize=chunksize, light=light, cleanup=initial, fast=not initial,
+                             shared=True)
+            except Exception:
+                log.exception('incremental search of {} failed'.format(directory))
+
+    search(initial=True)
+    inotify = None if poll else _start_inotify(directories)
+    regex, _ = _compile_patterns(scene_patterns)
+    pending = {}
+    last_search = time.monotonic()
+    try:
+        while True:
+            if inotify is None:
+                time.sleep(interval)
+                search()
+                continue
+            overflow = False
+            timeout = settle if pending else max(0., interval - (time.monotonic() - last_search))
+            for mask, path in inotify.read(timeout):
+                now = time.monotonic()
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & IN_ISDIR:
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        # a folder moved within the watched directories is watched again at its new path
+                        inotify.remove_tree(path)
+                        prefix = os.path.join(path, '')
+                        for scene in [x for x in pending if x.startswith(prefix)]:
+                            del pending[scene]
+                    elif mask & (IN_CREATE | IN_MOVED_TO):
+                        # a new or moved in folder may already contain scenes
+                        try:
+                            inotify.add_tree(path)
+                        except OSError as e:
+                            log.warning('could not watch {}: {}'.format(path, e))
+                            overflow = True
+                        pending.update((scene, now) for scene in scan_directory(path))
+                elif regex.search(os.path.basename(path)):
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        pending.pop(path, None)
+                    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        pending[path] = now
+            now = time.monotonic()
+            settled = [scene for scene, changed in pending.items() if now - changed >= settle]
+            for scene in settled:
+                del pending[scene]
+            if len(settled) > 0:
+                try:
+                    _ingest_scenes(open_db, settled, regex, light=light, workers=workers, chunksize=chunksize)
+                except Exception:
+                    log.exception('ingesting {} scenes failed'.format(len(settled)))
+            if overflow or now - last_search >= interval:
+                search()
+                last_search = time.monotonic()
+    except KeyboardInterrupt:
+        log.info('watch stopped')
+    finally:
+        if inotify is not None:
+            inotify.close()
+        dispose_engines()
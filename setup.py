@@ -61,5 +61,8 @@ setup(
                       'shapely',
                       'sentinelsat',
                       'pyrosar',
-                      'spatialist']
+                      'spatialist'],
+
+    extras_require={'service': ['asyncpg'],
+                    'snapshot': ['pyarrow']}
 )
@@ -4,6 +4,7 @@ import pytest
 import platform
 import tarfile as tf
 import os
+import shutil
 from datetime import datetime
 from spatialist import Vector
 from sqlalchemy import Table, MetaData, Column, Integer, String
@@ -47,10 +48,23 @@ def test_archive(tmpdir, testdata, testdir):
         # check ingests
         assert db.is_registered(testdata['s2'], 'sentinel2data') is True
         assert db.is_registered(testdata['s1'], 'sentinel1data') is True
+        assert db.are_registered([testdata['s2'], os.path.basename(testdata['s2']), testdata['s2_2']],
+                                 'sentinel2data') == {testdata['s2']: True,
+                                                      os.path.basename(testdata['s2']): True,
+                                                      testdata['s2_2']: False}
         # test rejecting doubles
         db.ingest_s2_from_id(testdata['s2'])
         db.ingest_s1_from_id(testdata['s1'])
 
+        # ingested scenes are queued again once their entries are removed
+        assert db.enqueue_scenes([testdata['s1']], 'sentinel1data') == 1
+        assert db.ingest_from_queue('sentinel1data') == {'ingested': 1, 'failed': 0}
+        assert db.enqueue_scenes([testdata['s1']], 'sentinel1data') == 0
+        db.drop_element(testdata['s1'], 'sentinel1data')
+        assert db.enqueue_scenes([testdata['s1']], 'sentinel1data') == 1
+        assert db.ingest_from_queue('sentinel1data') == {'ingested': 1, 'failed': 0}
+        assert db.is_registered(testdata['s1'], 'sentinel1data') is True
+
         #db.drop_element(testdata['s1'], 'duplicatesisos')
 
         db.add_tables(mytable)
@@ -62,6 +76,10 @@ def test_archive(tmpdir, testdata, testdir):
         db.cleanup()
 
         assert db.get_primary_keys('sentinel2data') == ['scene']
+        assert db.ensure_indexes() == []
+        db.conn.execute('DROP INDEX ix_sentinel2data_product_type;')
+        db.conn.execute('DROP INDEX idx_sentinel2data_footprint;')
+        assert sorted(db.ensure_indexes()) == ['idx_sentinel2data_footprint', 'ix_sentinel2data_product_type']
         assert len(db.get_unique_directories('sentinel2data')) == 1
 
         assert len(db.filter_scenelist([testdata['s2'], testdata['s2_2']], 'sentinel2data')) == 1
@@ -82,6 +100,17 @@ def test_archive(tmpdir, testdata, testdir):
         #print(db.query_db('sentinel1data', ['scene'], orbit='A'))
         assert db.query_db('sentinel1data', ['sensor', '"orbitNumber_rel"'], acquisition_mode='IW',
                           lines=16685, vv=1) == [{'orbitNumber_rel': 117, 'sensor': 'S1A'}]
+        assert db.query_db('sentinel1data', ['start_time', 'datatake_id', 'product_unique_id'],
+                           date=['20150222T000000', '20150223T000000']) == \
+               [{'start_time': datetime(2015, 2, 22, 17, 7, 50), 'datatake_id': '005DD8', 'product_unique_id': '3768'}]
+        assert db.query_db('sentinel2data', ['mgrs_tile', 'relative_orbit'], product_type='S2MSI2A') == \
+               [{'mgrs_tile': '32QMG', 'relative_orbit': 79}]
+        assert db.query_db('sentinel1data', ['datatake_id'], scene=os.path.basename(testdata['s1'])) == \
+               [{'datatake_id': '005DD8'}]
+        assert list(db.query_db_iter('sentinel2data', ['product_type'], fetch_size=1, processing_level='Level-2A')) == \
+               [{'product_type': 'S2MSI2A'}]
+        assert [len(x) for x in db.query_db_iter('sentinel1data', ['scene', 'bbox'], output='numpy')] == [1]
+        assert db.backfill('sentinel1data') == 0
         db.ingest_s2_from_id(testdata['s2_dup'])
         db.ingest_s2_from_id(testdata['s2_3'])
 
@@ -89,12 +118,34 @@ def test_archive(tmpdir, testdata, testdir):
                [('S2A_MSIL1C_20191228T144721_N0208_R139_T19MGQ_20191228T163224.zip', 1),
                 ('S2B_MSIL2A_20220117T095239_N0301_R079_T32QMG_20220117T113605.zip', 2)]
 
+        from isos.snapshot import export_parquet, import_parquet
+        snapshot = os.path.join(str(tmpdir), 'snapshot')
+        assert export_parquet(db, snapshot, tables=['sentinel2data'], rows_per_file=2)['sentinel2data'] == 3
+        assert len(os.listdir(os.path.join(snapshot, 'sentinel2data'))) == 2
+        assert import_parquet(db, snapshot) == {'sentinel2data': 0}
+        assert import_parquet(db, snapshot, update=True) == {'sentinel2data': 3}
+
+        src = os.path.join(str(tmpdir), 'src', 'sub')
+        os.makedirs(src)
+        scene = shutil.copy(testdata['s2_3'], src)
+        db.ingest_light(scene)
+        assert db.relocate(os.path.dirname(src), os.path.join(str(tmpdir), 'dst'))['renamed'] == 1
+        moved = os.path.join(str(tmpdir), 'dst', 'sub', os.path.basename(scene))
+        assert os.path.isfile(moved) and not os.path.isfile(scene)
+        assert db.are_registered([scene, moved], 'sentinel2data') == {scene: False, moved: True}
+        assert db.resume_relocation() == 0
+
         es1_colnames = {i.name: i.type for i in db.load_table('existings1').c}
         es2_colnames = {i.name: i.type for i in db.load_table('existings2').c}
 
         assert str(es1_colnames) == str(es2_colnames)
         assert str(es2_colnames) == "{'scene': VARCHAR(), 'outname_base': VARCHAR(), 'read_permission': " \
                                     "INTEGER(), 'file_size_MB': INTEGER(), 'owner': VARCHAR()}"
+    open_db = isos.database_factory('isos_db', port=pgport, user='markuszehner', password=pgpassword)
+    with open_db() as db, open_db() as db2:
+        assert db.get_schema_version() == isos.schema_version()
+        assert db.engine is db2.engine
+    isos.dispose_engines()
     print('works')
     isos.search_and_deploy.filewalker(directory=testdir, user='markuszehner', password=pgpassword, port=pgport)
     isos.ingest_from_exist_table(user='markuszehner', password=pgpassword, port=pgport)
@@ -120,4 +171,95 @@ def test_archive(tmpdir, testdata, testdir):
     # tables_to_create # tested in init
 
 
+def test_migrate(testdata):
+    pgpassword = os.environ.get('PGPASSWORD')
+    with isos.Database('isos_migrate', user='markuszehner', password=pgpassword, cleanup=False) as db:
+        # the schema before the computed file name columns
+        db.conn.execute('ALTER TABLE sentinel1data DROP COLUMN filename;')
+        db.ingest_light(testdata['s1'])
+        assert db.migrate() == {'sentinel1data': ['filename']}
+        assert db.query_db('sentinel1data', ['filename']) == [{'filename': os.path.basename(testdata['s1'])}]
+        assert db.is_registered(os.path.basename(testdata['s1']), 'sentinel1data') is True
+        isos.drop_archive(db)
+
+
+def test_light_entry(testdata):
+    from isos.database import _light_entry
+    entry = _light_entry('sentinel1data', testdata['s1'])
+    assert entry['orbitNumber_rel'] == 117
+    assert (entry['vv'], entry['vh'], entry['hh']) == (1, 1, 0)
+    assert entry['start_time'] == datetime(2015, 2, 22, 17, 7, 50)
+    assert entry['metadata_level'] == 'light'
+    assert 'orbit' not in entry and 'outname_base' not in entry
+    entry = _light_entry('sentinel2data', testdata['s2'])
+    assert (entry['mgrs_tile'], entry['relative_orbit'], entry['product_type']) == ('32QMG', 79, 'S2MSI2A')
+    assert _light_entry('sentinel2data', testdata['s1']) is None
+
+
+def test_partial_hash(testdata):
+    from isos.database import _partial_hash, _full_hash
+    first = _partial_hash(testdata['s2'], blocksize=4096)
+    second = _partial_hash(testdata['s2_dup'], blocksize=4096)
+    assert first['partial_hash'] == second['partial_hash']
+    assert first['file_size'] == os.path.getsize(testdata['s2'])
+    assert _partial_hash(testdata['s2_2'], blocksize=4096)['partial_hash'] != first['partial_hash']
+    assert _full_hash(testdata['s2']) == _full_hash(testdata['s2_dup'])
+
+
+def test_convert_metadata():
+    from isos.database import _compile_converters, _convert_metadata
+    from isos.database_tables import Sentinel2Data
+    converters = _compile_converters(Sentinel2Data.__table__)
+    assert 'filename' not in converters
+    metadata = {'BOA_QUANTIFICATION_VALUE': '10000', 'DATATAKE_1_SENSING_ORBIT_NUMBER': '8.0',
+                'CLOUD_COVERAGE_ASSESSMENT': '95.271085', 'PRODUCT_TYPE': 'S2MSI2A',
+                'GENERATION_TIME': '2020-02-02T12:31:31.000000Z', 'PRODUCT_START_TIME': '2020-02-02T10:41:49.024Z',
+                'PRODUCT_STOP_TIME': '', 'UNKNOWN KEY': 'x'}
+    keys = {}
+    (scene, values), = _convert_metadata([('a.zip', metadata)], converters, keys)
+    assert scene == 'a.zip'
+    assert values['boa_quantification_value'] == 10000
+    assert values['datatake_1_sensing_orbit_number'] == 8
+    assert values['cloud_coverage_assessment'] == 95.271085
+    assert values['product_type'] == 'S2MSI2A'
+    assert values['generation_time'].replace(tzinfo=None) == datetime(2020, 2, 2, 12, 31, 31)
+    assert values['product_start_time'].utcoffset().total_seconds() == 0
+    assert 'product_stop_time' not in values and 'unknown_key' not in values
+    assert keys['UNKNOWN KEY'] is None
+
+
+def test_read_s2_metadata_zip(testdata):
+    from isos.database import _read_s2_metadata, _read_s2_metadata_zip
+    for scene in [testdata['s2'], testdata['s2_3']]:
+        filename, metadata = _read_s2_metadata_zip(scene)
+        assert filename == scene
+        assert metadata == _read_s2_metadata(scene)[1]
+    metadata = _read_s2_metadata_zip(testdata['s2'])[1]
+    assert metadata['PRODUCT_URI'] == 'S2B_MSIL2A_20220117T095239_N0301_R079_T32QMG_20220117T113605.SAFE'
+    assert metadata['DATATAKE_1_SENSING_ORBIT_NUMBER'] == '79'
+    assert metadata['GENERAL_QUALITY'] == 'PASSED'
+    assert metadata['WVP_QUANTIFICATION_VALUE_UNIT'] == 'cm'
+    assert metadata['FOOTPRINT'].startswith('POLYGON((8.04431566854565 19.893861387245206, ')
+    assert _read_s2_metadata_zip(testdata['s1']) == (testdata['s1'], None)
+
 
+def test_batch_converter():
+    import struct
+    from geoalchemy2 import WKBElement
+    from isos.database import _batch_converter, _ewkb_to_wkb
+    from isos.database_tables import Sentinel1Data
+    table = Sentinel1Data.__table__
+    columns = [table.c.scene, table.c.lines, table.c.start_time, table.c.geometry]
+    wkb = struct.pack('<BI2d', 1, 1, 8.5, 50.5)
+    ewkb = struct.pack('<BII2d', 1, 0x20000001, 4326, 8.5, 50.5)
+    assert _ewkb_to_wkb(ewkb) == wkb and _ewkb_to_wkb(wkb) == wkb and _ewkb_to_wkb(ewkb.hex()) == wkb
+    rows = [('a.zip', 16685, datetime(2015, 2, 22, 17, 7, 50), WKBElement(ewkb, extended=True)),
+            ('b.zip', None, None, None)]
+    array = _batch_converter(columns, 'numpy')(rows)
+    assert list(array['scene']) == ['a.zip', 'b.zip']
+    assert array['lines'][0] == 16685 and str(array['lines'][1]) == 'nan'
+    assert str(array['start_time'][0]) == '2015-02-22T17:07:50.000000' and str(array['start_time'][1]) == 'NaT'
+    assert array['geometry'][0] == wkb and array['geometry'][1] is None
+    batch = _batch_converter(columns, 'arrow')(rows)
+    assert batch.num_rows == 2 and batch.column('lines').to_pylist() == [16685, None]
+    assert batch.column('geometry').to_pylist() == [wkb, None]
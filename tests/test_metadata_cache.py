@@ -0,0 +1,27 @@
+import os
+from isos.metadata_cache import MetadataCache
+
+
+def test_metadata_cache(tmpdir):
+    scenes = []
+    for i in range(3):
+        scene = os.path.join(str(tmpdir), 'scene{}.zip'.format(i))
+        with open(scene, 'w') as f:
+            f.write('x' * i)
+        scenes.append(scene)
+    path = os.path.join(str(tmpdir), 'cache.sqlite')
+    with MetadataCache(path, max_entries=2) as cache:
+        cache.put('sentinel2data', [(scenes[0], {'PRODUCT_TYPE': 'S2MSI2A'}), (scenes[1], {'PRODUCT_TYPE': 'S2MSI1C'})])
+        assert cache.get('sentinel2data', scenes) == {scenes[0]: {'PRODUCT_TYPE': 'S2MSI2A'},
+                                                      scenes[1]: {'PRODUCT_TYPE': 'S2MSI1C'}}
+        assert cache.get('sentinel1data', scenes) == {}
+        # a changed file is read again
+        with open(scenes[0], 'a') as f:
+            f.write('y')
+        assert list(cache.get('sentinel2data', scenes)) == [scenes[1]]
+        # the least recently used entry is evicted
+        cache.put('sentinel2data', [(scenes[2], {'PRODUCT_TYPE': 'S2MSI2A'})])
+        assert len(cache) == 1
+        assert list(cache.get('sentinel2data', scenes)) == [scenes[2]]
+    with MetadataCache(path) as cache:
+        assert len(cache) == 1
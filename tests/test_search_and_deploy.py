@@ -0,0 +1,37 @@
+import os
+import time
+import shutil
+
+from isos.search_and_deploy import scan_directory, scan_incremental
+
+
+def test_scan_directory(testdir, testdata):
+    found = scan_directory(testdir, workers=4)
+    assert len(found) == 14
+    assert found[testdata['s1']][0] == 's1'
+    assert found[testdata['s2_dup']][0] == 's2'
+    assert found[testdata['s2']][1].st_size == os.stat(testdata['s2']).st_size
+
+
+def test_scan_incremental(tmpdir, testdata):
+    root = str(tmpdir)
+    os.makedirs(os.path.join(root, 'a', 'b'))
+    s1 = shutil.copy(testdata['s1'], os.path.join(root, 'a'))
+    s2 = shutil.copy(testdata['s2'], os.path.join(root, 'a', 'b'))
+    open(os.path.join(root, 'a', 'no_scene.zip'), 'w').close()
+
+    first = scan_incremental(root, {}, {})
+    assert sorted(first['added']) == sorted([s1, s2])
+    assert first['changed'] == [] and first['removed'] == []
+
+    dirs = first['directories']
+    files = {scene: (st.st_size, st.st_mtime_ns, st.st_ino) for scene, (key, st) in first['files'].items()}
+    second = scan_incremental(root, dirs, files)
+    assert second['added'] == second['changed'] == second['removed'] == []
+    assert second['directories'] == {}
+
+    time.sleep(0.1)  # directory timestamps are updated at clock tick granularity
+    shutil.rmtree(os.path.join(root, 'a', 'b'))
+    third = scan_incremental(root, dirs, files)
+    assert third['removed'] == [s2]
+    assert third['removed_directories'] == [os.path.join(root, 'a', 'b')]
@@ -0,0 +1,52 @@
+import asyncio
+
+from isos.service import Coalescer, QueryService
+
+
+def test_coalescer():
+    calls = []
+
+    async def lookup(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return value * 2
+
+    async def main():
+        coalescer = Coalescer(ttl=60, size=1)
+        results = await asyncio.gather(*[coalescer.run(('a', 1), lambda: lookup(1)) for _ in range(100)])
+        assert results == [2] * 100
+        assert await coalescer.run(('a', 1), lambda: lookup(1)) == 2
+        assert calls == [1]
+        assert await coalescer.run(('a', 2), lambda: lookup(2)) == 4
+        # the cache holds one result
+        assert await coalescer.run(('a', 1), lambda: lookup(1)) == 2
+        assert calls == [1, 2, 1]
+
+    asyncio.run(main())
+
+
+def test_body_limit():
+    class Writer(object):
+        def __init__(self):
+            self.data = b''
+
+        def write(self, data):
+            self.data += data
+
+        async def drain(self):
+            pass
+
+        def close(self):
+            pass
+
+    async def main():
+        service = QueryService.__new__(QueryService)
+        service.max_body = 1024
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'POST /query_db HTTP/1.1\r\nContent-Length: 1000000000\r\n\r\n')
+        reader.feed_eof()
+        writer = Writer()
+        await service.handle(reader, writer)
+        assert writer.data.startswith(b'HTTP/1.1 413 Payload Too Large\r\n')
+
+    asyncio.run(main())
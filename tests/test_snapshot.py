@@ -0,0 +1,25 @@
+import json
+import struct
+from isos.snapshot import _ewkb_hex, _copy_value, _geo_metadata
+from isos.database_tables import Sentinel1Data, ExistingS1
+
+
+def test_ewkb_hex():
+    wkb = struct.pack('<BI2d', 1, 1, 8.5, 50.5)
+    ewkb = bytes.fromhex(_ewkb_hex(wkb, 4326))
+    assert struct.unpack('<BII2d', ewkb) == (1, 0x20000001, 4326, 8.5, 50.5)
+    wkb = struct.pack('>BI2d', 0, 1, 8.5, 50.5)
+    assert struct.unpack('>BII2d', bytes.fromhex(_ewkb_hex(wkb, 4326))) == (0, 0x20000001, 4326, 8.5, 50.5)
+
+
+def test_copy_value():
+    assert _copy_value(None) == '\\N'
+    assert _copy_value('a\tb\\c\nd') == 'a\\tb\\\\c\\nd'
+    assert _copy_value(16685) == '16685'
+
+
+def test_geo_metadata():
+    metadata = json.loads(_geo_metadata(list(Sentinel1Data.__table__.c))[b'geo'])
+    assert metadata['primary_column'] == 'geometry'
+    assert metadata['columns']['bbox'] == {'encoding': 'WKB', 'geometry_types': ['Polygon']}
+    assert _geo_metadata(list(ExistingS1.__table__.c)) is None
@@ -0,0 +1,31 @@
+import os
+
+from isos.watch import Inotify, IN_MOVED_TO, IN_MOVED_FROM, IN_CLOSE_WRITE, IN_ISDIR
+
+
+def test_inotify(tmpdir):
+    root = os.path.join(str(tmpdir), 'watched')
+    os.makedirs(root)
+    inotify = Inotify()
+    assert inotify.add_tree(root) == 1
+    incomplete = os.path.join(root, 'S1A_scene.zip.incomplete')
+    open(incomplete, 'w').close()
+    os.rename(incomplete, os.path.join(root, 'S1A_scene.zip'))
+    os.makedirs(os.path.join(root, 'sub'))
+    events = inotify.read(1)
+    assert (IN_MOVED_TO, os.path.join(root, 'S1A_scene.zip')) in events
+    assert any(mask & IN_ISDIR and path == os.path.join(root, 'sub') for mask, path in events)
+
+    assert inotify.add_tree(os.path.join(root, 'sub')) == 1
+    open(os.path.join(root, 'sub', 'new.zip'), 'w').close()
+    assert (IN_CLOSE_WRITE, os.path.join(root, 'sub', 'new.zip')) in inotify.read(1)
+
+    # a folder moved away is no longer watched
+    outside = os.path.join(str(tmpdir), 'outside')
+    os.rename(os.path.join(root, 'sub'), outside)
+    assert (IN_MOVED_FROM | IN_ISDIR, os.path.join(root, 'sub')) in inotify.read(1)
+    assert inotify.remove_tree(os.path.join(root, 'sub')) == 1
+    assert list(inotify.watches.values()) == [root]
+    open(os.path.join(outside, 'other.zip'), 'w').close()
+    assert inotify.read(1) == []
+    inotify.close()